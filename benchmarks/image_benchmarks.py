@@ -0,0 +1,183 @@
+""" Benchmarks for the `split` and `stitch` plugins using synthetic images.
+
+Run from the repository root:
+
+    python -m benchmarks.image_benchmarks --output results.json
+
+Every run happens in a fresh process so that its peak RSS is not hidden by an earlier run.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+import PIL
+
+from benchmarks import synthetic
+from xappt_plugins.plugins.image_manipulation import pixels
+from xappt_plugins.plugins.image_manipulation.split_image import SplitImage
+from xappt_plugins.plugins.image_manipulation.stitch_frames import StitchImages
+from xappt_plugins.utilities import HeadlessInterface
+
+# resource is not available on Windows, peak RSS is reported as null there
+try:
+    import resource
+except ImportError:
+    resource = None
+
+PLUGINS = {
+    "split": SplitImage,
+    "stitch": StitchImages,
+}
+
+BenchmarkCase = namedtuple("BenchmarkCase", ["name", "plugin", "parameters", "megapixels"])
+
+
+def peak_rss() -> Optional[int]:
+    """ The peak resident set size of this process and its children, in bytes. """
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # macOS reports bytes, everything else reports kilobytes
+    if sys.platform == "darwin":
+        return peak
+    return peak * 1024
+
+
+def run_case(case: BenchmarkCase) -> Dict:
+    interface = HeadlessInterface()
+    tool = PLUGINS[case.plugin](interface=interface, **case.parameters)
+    start_rss = peak_rss()
+    start = time.perf_counter()
+    result = interface.invoke(tool)
+    elapsed = time.perf_counter() - start
+    return {"result": result, "wall_time": elapsed, "start_rss": start_rss, "peak_rss": peak_rss()}
+
+
+def run_isolated(case: BenchmarkCase) -> Dict:
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(run_case, case).result()
+
+
+def build_cases(options: argparse.Namespace, work_path: str) -> List[BenchmarkCase]:
+    common = {"replace": True, "incremental": False, "jobs": options.jobs, "spill": options.spill}
+    cases = []
+    for fmt in options.formats:
+        extension = f".{fmt}"
+        if "split" in options.plugins:
+            size = options.atlas_size
+            name = f"split-{fmt}-{size}px-{options.tile_size}px-tiles"
+            case_path = os.path.join(work_path, name)
+            os.makedirs(os.path.join(case_path, "output"))
+            atlas_file = synthetic.make_atlas(case_path, "atlas", extension, (size, size), seed=options.seed)
+            parameters = dict(common, input_image=atlas_file, output_path=os.path.join(case_path, "output"),
+                              tile_size=options.tile_size)
+            cases.append(BenchmarkCase(name, "split", parameters, size * size / 1e6))
+
+        if "stitch" in options.plugins:
+            size = options.frame_size
+            name = f"stitch-{fmt}-{options.sequences}x{options.frame_count}-{size}px-frames"
+            case_path = os.path.join(work_path, name)
+            input_path = os.path.join(case_path, "input")
+            os.makedirs(input_path)
+            os.makedirs(os.path.join(case_path, "output"))
+            for sequence in range(options.sequences):
+                synthetic.make_sequence(input_path, f"sequence{sequence:02d}-frame", extension, (size, size),
+                                        options.frame_count, seed=options.seed + sequence)
+            parameters = dict(common, input_path=input_path, output_path=os.path.join(case_path, "output"),
+                              layout=options.layout, parallel_sequences=options.parallel_sequences)
+            megapixels = size * size * options.frame_count * options.sequences / 1e6
+            cases.append(BenchmarkCase(name, "stitch", parameters, megapixels))
+    return cases
+
+
+def summarize_runs(case: BenchmarkCase, runs: Sequence[Dict]) -> Dict:
+    wall_times = [run['wall_time'] for run in runs]
+    median = statistics.median(wall_times)
+    peaks = [run['peak_rss'] for run in runs if run['peak_rss'] is not None]
+    return {
+        "name": case.name,
+        "plugin": case.plugin,
+        "parameters": {key: value for key, value in case.parameters.items() if not key.endswith(("_path", "_image"))},
+        "megapixels": case.megapixels,
+        "failed": any(run['result'] != 0 for run in runs),
+        "wall_time": {"median": median, "min": min(wall_times), "max": max(wall_times)},
+        "peak_rss": max(peaks) if len(peaks) else None,
+        "throughput_mps": case.megapixels / median,
+        "runs": list(runs),
+    }
+
+
+def machine_info() -> Dict:
+    return {
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "pillow": PIL.__version__,
+        "numpy": pixels.numpy.__version__ if pixels.HAS_NUMPY else None,
+    }
+
+
+def parse_args(argv: Optional[Sequence[str]]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the split and stitch plugins with synthetic images.")
+    parser.add_argument("--output", "-o", help="Where to save the JSON results. Printed to stdout if omitted.")
+    parser.add_argument("--plugins", nargs="+", choices=tuple(PLUGINS.keys()), default=list(PLUGINS.keys()))
+    parser.add_argument("--formats", nargs="+", choices=("png", "jpg"), default=["png", "jpg"])
+    parser.add_argument("--repeat", type=int, default=3, help="How many times to run each benchmark.")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--atlas-size", type=int, default=4096, help="Width and height of the atlas to split.")
+    parser.add_argument("--tile-size", type=int, default=64)
+    parser.add_argument("--frame-size", type=int, default=256, help="Width and height of each frame to stitch.")
+    parser.add_argument("--frame-count", type=int, default=64, help="Frames in each sequence.")
+    parser.add_argument("--sequences", type=int, default=1)
+    parser.add_argument("--parallel-sequences", type=int, default=1)
+    parser.add_argument("--layout", default="grid")
+    parser.add_argument("--spill", action="store_true", help="Spill the working image to a memory-mapped file.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true", help="Keep the generated images and outputs.")
+    options = parser.parse_args(argv)
+    if options.atlas_size % options.tile_size != 0:
+        parser.error("--atlas-size must be evenly divisible by --tile-size")
+    if options.repeat < 1:
+        parser.error("--repeat must be at least 1")
+    return options
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    options = parse_args(argv)
+    work_path = tempfile.mkdtemp(prefix="xp-bench-")
+    results = []
+    try:
+        for case in build_cases(options, work_path):
+            summary = summarize_runs(case, [run_isolated(case) for _ in range(options.repeat)])
+            results.append(summary)
+            print(f"{case.name}: {summary['wall_time']['median']:.3f}s, "
+                  f"{summary['throughput_mps']:.1f} MP/s", file=sys.stderr)
+    finally:
+        if options.keep:
+            print(f"Benchmark files kept in '{work_path}'", file=sys.stderr)
+        else:
+            shutil.rmtree(work_path, ignore_errors=True)
+
+    report = json.dumps({"machine": machine_info(), "results": results}, indent=2)
+    if options.output:
+        with open(options.output, "w", newline="\n") as fp:
+            fp.write(report)
+    else:
+        print(report)
+    return 1 if any(result['failed'] for result in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
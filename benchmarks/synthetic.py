@@ -0,0 +1,43 @@
+import os
+import random
+
+from typing import List, Tuple
+
+from PIL import Image
+
+FORMAT_MODES = {
+    ".png": "RGBA",
+    ".jpg": "RGB",
+}
+
+# noise is generated at 1/DETAIL of the final resolution and scaled up, which gives smooth
+# gradients that compress more like real artwork than full resolution noise would
+DETAIL = 8
+
+
+def noise_image(rng: random.Random, mode: str, size: Tuple[int, int]) -> Image.Image:
+    width, height = size
+    small_size = (max(1, width // DETAIL), max(1, height // DETAIL))
+    byte_count = small_size[0] * small_size[1] * Image.getmodebands(mode)
+    data = rng.getrandbits(byte_count * 8).to_bytes(byte_count, "little")
+    return Image.frombytes(mode, small_size, data).resize(size, Image.BILINEAR)
+
+
+def make_sequence(path: str, name: str, extension: str, frame_size: Tuple[int, int], frame_count: int, *,
+                  seed: int = 0) -> List[str]:
+    """ Save `frame_count` frames named `{name}0001{extension}` and so on into `path`. """
+    rng = random.Random(seed)
+    mode = FORMAT_MODES[extension]
+    frames = []
+    for frame in range(1, frame_count + 1):
+        frame_name = f"{name}{frame:04d}{extension}"
+        noise_image(rng, mode, frame_size).save(os.path.join(path, frame_name))
+        frames.append(frame_name)
+    return frames
+
+
+def make_atlas(path: str, name: str, extension: str, size: Tuple[int, int], *, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    atlas_file = os.path.join(path, f"{name}{extension}")
+    noise_image(rng, FORMAT_MODES[extension], size).save(atlas_file)
+    return atlas_file
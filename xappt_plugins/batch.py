@@ -0,0 +1,181 @@
+""" Run many plugin jobs from a single job file, without a user interface.
+
+    python -m xappt_plugins.batch jobs.json --report results.json --workers 2
+
+The job file is JSON, or YAML if PyYAML is installed:
+
+    {
+        "defaults": {"stitch": {"replace": true}},
+        "jobs": [
+            {"plugin": "split", "parameters": {"input_image": "atlas.png", "output_path": "tiles", "tile_size": 64}},
+            {"plugin": "stitch", "name": "walk", "parameters": {"input_path": "walk", "output_path": "sheets"}}
+        ]
+    }
+
+Plugins are loaded once, and the jobs run on a shared pool of `--workers` threads.
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import sys
+import time
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Sequence
+
+import xappt
+
+import xappt_plugins.plugins
+from xappt_plugins.utilities import HeadlessInterface
+
+# PyYAML is optional, job files can always be written as JSON
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+logger = logging.getLogger("xappt")
+
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+
+BatchJob = namedtuple("BatchJob", ["index", "name", "plugin", "parameters"])
+
+# the keys a job in a job file may have
+JOB_KEYS = {"plugin", "name", "parameters"}
+
+
+class RecordingInterface(HeadlessInterface):
+    """ A `HeadlessInterface` that also keeps every message so it can be included in the report. """
+    def __init__(self, *, answer: bool = False):
+        super().__init__(answer=answer)
+        self.messages: List[str] = []
+        self.warnings: List[str] = []
+        self.errors: List[str] = []
+
+    def message(self, message: str):
+        self.messages.append(message)
+        super().message(message)
+
+    def warning(self, message: str):
+        self.warnings.append(message)
+        super().warning(message)
+
+    def error(self, message: str, *, details: Optional[str] = None):
+        if details is not None and len(details):
+            message = f"{message}\n{details}"
+        self.errors.append(message)
+        super().error(message)
+
+
+def load_job_file(path: str) -> Dict:
+    with open(path, "r") as fp:
+        if os.path.splitext(path)[1].lower() in (".yaml", ".yml"):
+            if yaml is None:
+                raise RuntimeError("PyYAML is required to read YAML job files")
+            return yaml.safe_load(fp)
+        return json.load(fp)
+
+
+def parse_jobs(data: Dict) -> List[BatchJob]:
+    defaults = data.get('defaults', {})
+    jobs = []
+    for index, job in enumerate(data.get('jobs', [])):
+        if "plugin" not in job:
+            raise ValueError(f"Job {index} does not name a plugin")
+        unknown = sorted(set(job.keys()) - JOB_KEYS)
+        if len(unknown):
+            raise ValueError(f"Job {index} has unknown keys: {', '.join(unknown)}. "
+                             f"Expected {', '.join(sorted(JOB_KEYS))}")
+        plugin = job['plugin']
+        parameters = dict(defaults.get(plugin, {}))
+        parameters.update(job.get('parameters', {}))
+        jobs.append(BatchJob(index, job.get('name', f"{plugin}-{index}"), plugin, parameters))
+    return jobs
+
+
+def run_job(job: BatchJob, *, answer: bool = False) -> Dict:
+    interface = RecordingInterface(answer=answer)
+    start = time.perf_counter()
+    result = None
+    try:
+        tool = xappt.get_tool_plugin(job.plugin)(interface=interface, **job.parameters)
+        known = set(parameter.name for parameter in tool.parameters())
+        unknown = sorted(set(job.parameters.keys()) - known)
+        if len(unknown):
+            raise ValueError(f"Unknown parameters for '{job.plugin}': {', '.join(unknown)}")
+        result = interface.invoke(tool)
+    except (Exception, xappt.ParameterValidationError) as e:
+        interface.error(f"Job '{job.name}' failed: {e}")
+    return {
+        "index": job.index,
+        "name": job.name,
+        "plugin": job.plugin,
+        "status": STATUS_SUCCEEDED if result == 0 else STATUS_FAILED,
+        "result": result,
+        "elapsed": time.perf_counter() - start,
+        "messages": interface.messages,
+        "warnings": interface.warnings,
+        "errors": interface.errors,
+    }
+
+
+def run_jobs(jobs: Sequence[BatchJob], *, workers: int = 1, answer: bool = False) -> List[Dict]:
+    results = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run_job, job, answer=answer) for job in jobs]
+        for future in as_completed(futures):
+            result = future.result()
+            logger.info(f"{result['name']}: {result['status']} in {result['elapsed']:.2f}s")
+            results.append(result)
+    return sorted(results, key=lambda r: r['index'])
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Run a batch of plugin jobs from a JSON or YAML job file.")
+    parser.add_argument("job_file", help="The JSON or YAML file listing the jobs to run.")
+    parser.add_argument("--report", "-r", help="Where to save the JSON results. Printed to stdout if omitted.")
+    parser.add_argument("--workers", "-w", type=int, default=1, help="How many jobs should run at the same time?")
+    parser.add_argument("--yes", "-y", action="store_true", help="Answer yes to any question a plugin asks.")
+    return parser
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    options = build_parser().parse_args(argv)
+    if options.workers < 1:
+        logger.error("--workers must be at least 1")
+        return 1
+
+    try:
+        jobs = parse_jobs(load_job_file(options.job_file))
+    except (OSError, ValueError, RuntimeError) as e:
+        logger.error(f"Could not read '{options.job_file}': {e}")
+        return 1
+
+    started = datetime.datetime.now()
+    start = time.perf_counter()
+    results = run_jobs(jobs, workers=options.workers, answer=options.yes)
+    counts = {status: 0 for status in (STATUS_SUCCEEDED, STATUS_FAILED)}
+    for result in results:
+        counts[result['status']] += 1
+
+    report = json.dumps({
+        "job_file": os.path.abspath(options.job_file),
+        "started": started.isoformat(timespec="seconds"),
+        "elapsed": time.perf_counter() - start,
+        "counts": counts,
+        "jobs": results,
+    }, indent=2)
+    if options.report:
+        with open(options.report, "w", newline="\n") as fp:
+            fp.write(report)
+    else:
+        print(report)
+    return 1 if counts[STATUS_FAILED] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
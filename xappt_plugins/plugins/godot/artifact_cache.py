@@ -0,0 +1,64 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+from typing import Dict, List, Optional, Sequence
+
+MANIFEST_NAME = "manifest.json"
+
+
+def artifact_key(inputs: Dict) -> str:
+    """ A hash of everything that goes into a build. `inputs` must be JSON serializable. """
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode("utf8")).hexdigest()
+
+
+def hash_secret(secret: str) -> str:
+    """ Secrets like the encryption key are part of the inputs, but only their hash is stored. """
+    if not len(secret):
+        return ""
+    return hashlib.sha256(secret.encode("utf8")).hexdigest()
+
+
+class ArtifactCache:
+    """ Binaries from earlier builds, kept in `cache_path` under a hash of the inputs that produced them.
+    Entries are written to a staging folder and renamed into place, so a partially stored entry is never found,
+    and builds running at the same time can share the cache.
+    """
+    def __init__(self, cache_path: str):
+        self.path = os.path.join(cache_path, "artifacts")
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], key)
+
+    def lookup(self, key: str) -> Optional[List[str]]:
+        """ Returns the cached files for `key`, or `None` if nothing has been stored for it. """
+        entry = self._entry_path(key)
+        try:
+            with open(os.path.join(entry, MANIFEST_NAME), "r") as fp:
+                manifest = json.load(fp)
+        except (OSError, ValueError):
+            return None
+        files = [os.path.join(entry, name) for name in manifest['files']]
+        if not all(os.path.isfile(f) for f in files):
+            return None
+        return files
+
+    def store(self, key: str, files: Sequence[str], inputs: Dict):
+        entry = self._entry_path(key)
+        if os.path.isdir(entry):
+            return
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        staging = tempfile.mkdtemp(prefix=f"{key}.", dir=os.path.dirname(entry))
+        try:
+            for f in files:
+                shutil.copy2(f, os.path.join(staging, os.path.basename(f)))
+            with open(os.path.join(staging, MANIFEST_NAME), "w", newline="\n") as fp:
+                json.dump({"inputs": inputs, "files": [os.path.basename(f) for f in files]}, fp, indent=2)
+            os.rename(staging, entry)
+        except OSError:
+            # most likely another build stored the same entry first
+            shutil.rmtree(staging, ignore_errors=True)
+            if not os.path.isdir(entry):
+                raise
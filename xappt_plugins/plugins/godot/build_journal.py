@@ -0,0 +1,87 @@
+import hashlib
+import json
+import os
+import threading
+import uuid
+
+from typing import Callable, Dict, Optional
+
+
+def journal_path(cache_path: str, manifest_path: str) -> str:
+    """ Every project gets its own journal, named after a hash of its manifest path. """
+    digest = hashlib.sha256(os.path.abspath(manifest_path).encode("utf8")).hexdigest()[:16]
+    return os.path.join(cache_path, "journals", f"{digest}.jsonl")
+
+
+class BuildJournal:
+    """ A record of the build steps that have completed, so a failed build can resume from the first step that
+    didn't. The first line of the file identifies the build, and every following line is a completed step with
+    any data needed to pick up after it. Steps may complete on several threads at once.
+
+    An existing journal is only resumed when `resume` is set and it was written for the same `identity`.
+    `run_id` stays the same across resumed runs of a build.
+    """
+    def __init__(self, path: str, identity: Dict, *, resume: bool):
+        self.path = path
+        self.run_id = ""
+        self._steps: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self.resumed = resume and self._load(identity)
+        if not self.resumed:
+            self.run_id = uuid.uuid4().hex
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", newline="\n") as fp:
+                fp.write(json.dumps({"identity": identity, "run_id": self.run_id}) + "\n")
+
+    def _load(self, identity: Dict) -> bool:
+        try:
+            with open(self.path, "r") as fp:
+                lines = [json.loads(line) for line in fp if len(line.strip())]
+        except (OSError, ValueError):
+            return False
+        if not len(lines) or lines[0].get('identity') != identity:
+            return False
+        self.run_id = lines[0]['run_id']
+        for line in lines[1:]:
+            if "discard" in line:
+                self._discard(line['discard'])
+            else:
+                self._steps[line['step']] = line['data']
+        return True
+
+    def _discard(self, prefix: str):
+        for step in [step for step in self._steps if step.startswith(prefix)]:
+            del self._steps[step]
+
+    def done(self, step: str) -> bool:
+        with self._lock:
+            return step in self._steps
+
+    def data(self, step: str) -> Optional[Dict]:
+        with self._lock:
+            return self._steps.get(step)
+
+    def record(self, step: str, **data):
+        with self._lock:
+            self._steps[step] = data
+            with open(self.path, "a", newline="\n") as fp:
+                fp.write(json.dumps({"step": step, "data": data}) + "\n")
+
+    def discard(self, prefix: str):
+        """ Forget the completed steps whose names start with `prefix`, so they run again. """
+        with self._lock:
+            self._discard(prefix)
+            with open(self.path, "a", newline="\n") as fp:
+                fp.write(json.dumps({"discard": prefix}) + "\n")
+
+    def run_step(self, step: str, fn: Callable[[], Optional[Dict]]) -> Dict:
+        """ Run `fn` unless `step` has already completed, and return the data it was recorded with. """
+        data = self.data(step)
+        if data is None:
+            data = fn() or {}
+            self.record(step, **data)
+        return data
+
+    def finish(self):
+        """ The build completed, so there is nothing left to resume. """
+        os.remove(self.path)
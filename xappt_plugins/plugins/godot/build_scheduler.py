@@ -0,0 +1,96 @@
+import os
+import queue
+
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+# one scons build in its own source tree: a target of a `BUILD_COMMANDS` entry, or its editor when `target` is None
+BuildJob = namedtuple("BuildJob", ["name", "platform", "build_vars", "target"])
+
+# when the number of concurrent builds is picked automatically, each build gets at least this many cores
+MIN_CORES_PER_BUILD = 8
+
+# how often the calling thread runs the messages posted by builds while it waits for them, in seconds
+POLL_INTERVAL = 0.1
+
+
+def plan_jobs(build_commands: Dict, platforms: Sequence[str], *, editor: bool) -> List[BuildJob]:
+    """ Split the selected platforms into independent builds, longest first so they don't hold up the end of the
+    schedule. Android architectures stay in one build, since gradle packages them together.
+    """
+    jobs = []
+    for platform in platforms:
+        build_vars = build_commands[platform]
+        if isinstance(build_vars, dict):
+            build_vars = [build_vars]
+        for var_set in build_vars:
+            prefix = "-".join(filter(None, (platform, var_set.get('variant'))))
+            for target in var_set['targets']:
+                jobs.append(BuildJob(f"{prefix}-{target}", platform, var_set, target))
+            if editor and "editor" in var_set:
+                jobs.append(BuildJob(f"{prefix}-editor", platform, var_set, None))
+    return sorted(jobs, key=job_cost, reverse=True)
+
+
+def job_cost(job: BuildJob) -> int:
+    """ A rough relative cost, editor builds compile roughly twice as much as a template. """
+    if job.target is None:
+        return 2
+    return len(job.build_vars.get('architectures', ())) or 1
+
+
+def split_cores(job_count: int, parallel: int = 0, cpu_count: Optional[int] = None) -> Tuple[int, int]:
+    """ Returns how many builds should run at the same time, and how many scons jobs each of them gets. """
+    cpu_count = cpu_count or os.cpu_count() or 1
+    if parallel <= 0:
+        parallel = max(1, cpu_count // MIN_CORES_PER_BUILD)
+    workers = max(1, min(parallel, job_count))
+    return workers, max(1, cpu_count // workers)
+
+
+def _run_messages(messages: Optional[queue.Queue]):
+    if messages is None:
+        return
+    while True:
+        try:
+            message = messages.get_nowait()
+        except queue.Empty:
+            return
+        message()
+
+
+def run_jobs(jobs: Sequence[BuildJob], build: Callable[[BuildJob], Any], *, workers: int,
+             on_done: Optional[Callable[[BuildJob, int], None]] = None,
+             messages: Optional[queue.Queue] = None) -> Dict[str, Any]:
+    """ Run `build` for every job on `workers` threads and return the results by job name. `on_done` is called
+    on the calling thread with each finished job and the number finished so far. If a build fails, builds that
+    haven't started are cancelled and the error is raised once the running ones finish.
+
+    Builds can put callables on `messages` to have them run on the calling thread, which is needed for anything
+    that touches a GUI. The queue is emptied while waiting for the builds.
+    """
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="godot-build") as executor:
+        futures = {executor.submit(build, job): job for job in jobs}
+        pending = set(futures)
+        done = 0
+        try:
+            while len(pending):
+                finished, pending = wait(pending, timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                _run_messages(messages)
+                for future in finished:
+                    job = futures[future]
+                    results[job.name] = future.result()
+                    done += 1
+                    if on_done is not None:
+                        on_done(job, done)
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            # keep running messages until the builds that already started have finished
+            while len(pending):
+                _, pending = wait(pending, timeout=POLL_INTERVAL)
+                _run_messages(messages)
+            raise
+    return results
@@ -0,0 +1,110 @@
+import contextlib
+import json
+import os
+import resource  # only available on posix, which is all `make-templates` supports
+import sys
+import threading
+import time
+
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Sequence
+
+TRACE_NAME = "build-trace.json"
+
+
+def _children_usage():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # ru_maxrss is in KiB on linux and in bytes on macOS
+    peak_rss = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+    return usage.ru_utime + usage.ru_stime, peak_rss
+
+
+def command_category(command: Sequence[str]) -> str:
+    program = os.path.basename(command[0])
+    if program.endswith("strip"):
+        return "strip"  # including the cross compiling strips
+    if program == "gradlew":
+        return "gradle"
+    return program
+
+
+def format_bytes(size: float) -> str:
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
+class BuildTracer:
+    """ Times every command and file step of a build, and saves them to `path` as a Chrome trace, which can be
+    opened in chrome://tracing or https://ui.perfetto.dev. Steps may run on several threads at once.
+
+    CPU time and peak memory come from `RUSAGE_CHILDREN`, which covers every child process that finished while a
+    step was running, so when builds run in parallel a step's CPU time can include other builds' commands.
+    The totals are exact.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._events: List[Dict] = []
+        self._threads: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self._start_cpu, _ = _children_usage()
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str, **args) -> Iterator[Dict]:
+        """ Time the block as a step. The yielded dict is saved with the step, a `bytes` entry is included in
+        the summary.
+        """
+        start = time.perf_counter()
+        start_cpu, _ = _children_usage()
+        try:
+            yield args
+        finally:
+            end = time.perf_counter()
+            end_cpu, peak_rss = _children_usage()
+            args.update({"cpu_seconds": end_cpu - start_cpu, "peak_rss": peak_rss})
+            thread = threading.current_thread()
+            with self._lock:
+                self._threads[thread.ident] = thread.name
+                self._events.append({
+                    "name": name,
+                    "cat": category,
+                    "ph": "X",
+                    "ts": (start - self._start) * 1e6,
+                    "dur": (end - start) * 1e6,
+                    "pid": os.getpid(),
+                    "tid": thread.ident,
+                    "args": args,
+                })
+
+    def save(self):
+        with self._lock:
+            events = list(self._events)
+            events.extend({"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": ident, "args": {"name": name}}
+                          for ident, name in self._threads.items())
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "w", newline="\n") as fp:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, fp)
+
+    def summary(self) -> str:
+        """ A table of the wall time, CPU time and bytes of each category of step. """
+        totals = OrderedDict()
+        with self._lock:
+            events = sorted(self._events, key=lambda e: e['ts'])
+        for event in events:
+            total = totals.setdefault(event['cat'], {"count": 0, "wall": 0.0, "cpu": 0.0, "bytes": 0})
+            total['count'] += 1
+            total['wall'] += event['dur'] / 1e6
+            total['cpu'] += event['args']['cpu_seconds']
+            total['bytes'] += event['args'].get('bytes', 0)
+
+        cpu, peak_rss = _children_usage()
+        lines = [f"{'Step':<10} {'Count':>6} {'Wall':>10} {'CPU':>10} {'Bytes':>12}"]
+        for category, total in totals.items():
+            size = format_bytes(total['bytes']) if total['bytes'] else "-"
+            lines.append(f"{category:<10} {total['count']:>6} {total['wall']:>9.1f}s {total['cpu']:>9.1f}s {size:>12}")
+        lines.append(f"Elapsed {time.perf_counter() - self._start:.1f}s, child CPU {cpu - self._start_cpu:.1f}s, "
+                     f"peak child memory {format_bytes(peak_rss)}")
+        return "\n".join(lines)
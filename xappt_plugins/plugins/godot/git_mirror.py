@@ -0,0 +1,127 @@
+import contextlib
+import fcntl  # only available on posix, which is all `make-templates` supports
+import os
+import re
+import shutil
+import subprocess
+
+from typing import Callable, Optional, Sequence, Set
+
+# run a command, raising if it fails: `run_command(command, cwd=...)`
+RunCommand = Callable[..., None]
+
+# where modules fetched from their repository's default branch are kept in the mirror
+HEAD_REF = "refs/xappt/head"
+
+
+def default_cache_path() -> str:
+    cache_root = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(cache_root, "xappt", "godot")
+
+
+@contextlib.contextmanager
+def file_lock(path: str):
+    """ Hold an exclusive lock on `path` for the duration of the block, across processes. """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as fp:
+        fcntl.flock(fp, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fp, fcntl.LOCK_UN)
+
+
+def mirror_name(url: str) -> str:
+    """ A folder name for the mirror of `url`, 'https://github.com/godotengine/godot.git' becomes
+    'github.com_godotengine_godot.git'.
+    """
+    name = re.sub(r"^\w+://", "", url.strip()).rstrip("/")
+    if name.endswith(".git"):
+        name = name[:-4]
+    return re.sub(r"[^\w.-]+", "_", name) + ".git"
+
+
+class GitMirror:
+    """ A bare repository in `cache_path` that mirrors `url`, and that checkouts are made from as worktrees,
+    so objects are only downloaded the first time they are needed. Only the requested tag or branch head is
+    fetched, without history. Fetches and worktree changes hold a lock on the mirror, so builds running at
+    the same time can share it.
+    """
+    def __init__(self, url: str, cache_path: str, run_command: RunCommand):
+        self.url = url
+        self.path = os.path.join(cache_path, "mirrors", mirror_name(url))
+        self.run_command = run_command
+
+    def _locked(self):
+        return file_lock(f"{self.path}.lock")
+
+    def _git(self, *args: str, cwd: Optional[str] = None):
+        self.run_command(("git", *args), cwd=cwd or self.path)
+
+    def _has_ref(self, ref: str) -> bool:
+        command = ("git", "rev-parse", "--verify", "--quiet", f"{ref}^{{commit}}")
+        return subprocess.run(command, cwd=self.path, stdout=subprocess.DEVNULL).returncode == 0
+
+    def _initialize(self):
+        if os.path.isdir(self.path):
+            return
+        self._git("init", "--bare", self.path, cwd=os.path.dirname(self.path))
+        self._git("remote", "add", "origin", self.url)
+
+    def _fetch(self, refspec: Sequence[str]):
+        self._git("fetch", "--depth", "1", "--no-tags", "origin", *refspec)
+
+    def fetch_tag(self, tag: str) -> str:
+        """ Fetch `tag` unless the mirror already has it, since tags aren't expected to move.
+        Returns the ref to check out.
+        """
+        ref = f"refs/tags/{tag}"
+        with self._locked():
+            self._initialize()
+            if not self._has_ref(ref):
+                self._fetch(("tag", tag))
+        return ref
+
+    def fetch_head(self) -> str:
+        """ Fetch the current head of the default branch. Returns the ref to check out. """
+        with self._locked():
+            self._initialize()
+            self._fetch((f"+HEAD:{HEAD_REF}",))
+        return HEAD_REF
+
+    def resolve(self, ref: str) -> str:
+        """ The commit hash that `ref` points to. """
+        command = ("git", "rev-parse", "--verify", f"{ref}^{{commit}}")
+        return subprocess.check_output(command, cwd=self.path, universal_newlines=True).strip()
+
+    def add_worktree(self, ref: str, path: str):
+        """ Check out `ref` into `path` as a detached worktree of the mirror. """
+        with self._locked():
+            self._git("worktree", "prune")
+            self._git("worktree", "add", "--detach", "--force", path, ref)
+
+    def checkout_worktree(self, ref: str, path: str):
+        """ Check out `ref` into `path`, reusing the worktree that is already there so that untracked build
+        products survive and the next build only recompiles what changed.
+        """
+        with self._locked():
+            self._git("worktree", "prune")
+            if os.path.isfile(os.path.join(path, ".git")):
+                self._git("checkout", "--force", "--detach", ref, cwd=path)
+                return
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            self._git("worktree", "add", "--detach", "--force", path, ref)
+
+    @staticmethod
+    def tracked_names(worktree: str, folder: str) -> Set[str]:
+        """ The names of the files and folders in `folder` that belong to the commit checked out in `worktree`. """
+        command = ("git", "ls-tree", "--name-only", f"HEAD:{folder}")
+        return set(subprocess.check_output(command, cwd=worktree, universal_newlines=True).splitlines())
+
+    def prune(self):
+        """ Forget worktrees whose folders have been removed. """
+        if not os.path.isdir(self.path):
+            return
+        with self._locked():
+            self._git("worktree", "prune")
@@ -1,15 +1,27 @@
+import contextlib
+import functools
 import json
 import os
+import queue
 import re
 import shutil
+import sys
+import threading
 
-from typing import Callable, Generator, Optional, Sequence
+from typing import Callable, Generator, List, Optional, Sequence, Tuple
 
 import xappt
-import xappt_qt
 
+from xappt_plugins.plugins.godot.artifact_cache import ArtifactCache, artifact_key, hash_secret
+from xappt_plugins.plugins.godot.build_journal import BuildJournal, journal_path
+from xappt_plugins.plugins.godot.build_scheduler import BuildJob, plan_jobs, run_jobs, split_cores
+from xappt_plugins.plugins.godot.build_trace import TRACE_NAME, BuildTracer, command_category
+from xappt_plugins.plugins.godot.git_mirror import GitMirror, default_cache_path, file_lock
+from xappt_plugins.plugins.godot.scons_cache import SConsCache
 from xappt_plugins.validators import *
-from xappt_plugins.utilities import open_file
+from xappt_plugins.utilities import lazy_import, open_file
+
+xappt_qt = lazy_import("xappt_qt")
 
 
 class ValidateProjectManifest(xappt.BaseValidator):
@@ -40,25 +52,27 @@ NAME_MAPPING = (
 BUILD_COMMANDS = {
     "windows": [
         {
+            "variant": "64",
             "strip_command": {
                 "bin": "x86_64-w64-mingw32-strip",
                 "regex": r"^.*64\.exe$",
             },
-            "command": ("scons", "-j8", "platform=windows", "use_mingw=yes", "tools=no",
+            "command": ("scons", "-j{jobs}", "platform=windows", "use_mingw=yes", "tools=no",
                         "target={target}", "bits=64", "use_lto=yes"),
             "targets": ("release", "release_debug"),
-            "editor": ("scons", "-j8", "platform=windows", "use_mingw=yes",
+            "editor": ("scons", "-j{jobs}", "platform=windows", "use_mingw=yes",
                        "target=release_debug", "bits=64", "use_lto=yes"),
         },
         {
+            "variant": "32",
             "strip_command": {
                 "bin": "i686-w64-mingw32-strip",
                 "regex": r"^.*32\.exe$",
             },
-            "command": ("scons", "-j8", "platform=windows", "use_mingw=yes", "tools=no",
+            "command": ("scons", "-j{jobs}", "platform=windows", "use_mingw=yes", "tools=no",
                         "target={target}", "bits=32", "use_lto=yes"),
             "targets": ("release", "release_debug"),
-            "editor": ("scons", "-j8", "platform=windows", "use_mingw=yes",
+            "editor": ("scons", "-j{jobs}", "platform=windows", "use_mingw=yes",
                        "target=release_debug", "bits=32", "use_lto=yes"),
         },
     ],
@@ -68,8 +82,9 @@ BUILD_COMMANDS = {
             "regex": r"^.*\.osx\..*\.64$",
         },
         "targets": ("release", "release_debug"),
-        "command": ("scons", "-j8", "platform=osx", "osxcross_sdk=darwin15", "tools=no", "target={target}", "bits=64"),
-        "editor": ("scons", "-j8", "platform=osx", "osxcross_sdk=darwin15", "target=release_debug", "bits=64"),
+        "command": ("scons", "-j{jobs}", "platform=osx", "osxcross_sdk=darwin15", "tools=no", "target={target}",
+                    "bits=64"),
+        "editor": ("scons", "-j{jobs}", "platform=osx", "osxcross_sdk=darwin15", "target=release_debug", "bits=64"),
     },
     "linux": {
         "strip_command": {
@@ -77,13 +92,13 @@ BUILD_COMMANDS = {
             "regex": r"^.*\.x11\..*\.64$",
         },
         "targets": ("release", "release_debug"),
-        "command": ("scons", "-j8", "platform=x11", "tools=no", "target={target}", "bits=64"),
-        "editor": ("scons", "-j8", "platform=x11", "target=release_debug", "bits=64"),
+        "command": ("scons", "-j{jobs}", "platform=x11", "tools=no", "target={target}", "bits=64"),
+        "editor": ("scons", "-j{jobs}", "platform=x11", "target=release_debug", "bits=64"),
     },
     "android": {
         "name_match": r"^.*\.(?:apk|zip)$",
         "targets": ("release", "release_debug"),
-        "command": ("scons", "-j8", "platform=android", "target={target}", "android_arch={arch}"),
+        "command": ("scons", "-j{jobs}", "platform=android", "target={target}", "android_arch={arch}"),
         "architectures": ("armv7", "arm64v8", "x86", "x86_64"),
         "post_target_commands": [
             {
@@ -94,6 +109,11 @@ BUILD_COMMANDS = {
     },
 }
 
+GODOT_REPOSITORY = "https://github.com/godotengine/godot.git"
+
+# written into a build tree with the id of the build that last checked it out
+BUILD_MARKER = ".xappt-build"
+
 GODOT_MODULES = {
     "smooth": {
         "repository": "https://github.com/lawnjelly/godot-smooth",
@@ -118,12 +138,28 @@ class MakeTemplates(xappt.BaseTool):
                             description="Should the editor tools also be built?")
     modules = xappt.ParamList(options={'short_name': "m"}, choices=list(GODOT_MODULES.keys()),
                               description="Which third party modules should be included?")
+    cache_path = xappt.ParamString(options={'short_name': "c", "ui": "folder-select"}, default=default_cache_path(),
+                                   description="Where should the git mirrors be kept between builds?")
+    parallel_builds = xappt.ParamInt(options={'short_name': "j"}, minimum=0, default=0,
+                                     description="How many builds should run at the same time? The available cores "
+                                                 "are split between them. 0 picks a number based on the cores.")
+    reuse_artifacts = xappt.ParamBool(options={'short_name': "a"}, default=True,
+                                      description="Should binaries from an earlier build with the same tag, modules, "
+                                                  "encryption key and build settings be reused?")
+    scons_cache_limit = xappt.ParamInt(options={'short_name': "l"}, minimum=0, default=4096,
+                                       description="How large can the SCons object cache grow, in MiB? "
+                                                   "0 turns the cache off.")
+    resume = xappt.ParamBool(options={'short_name': "r"}, default=False,
+                             description="Should a failed build continue from the first step that didn't complete?")
 
     def __init__(self, interface: xappt.BaseInterface, **kwargs):
         super().__init__(interface=interface, **kwargs)
         self.cmd = xappt.CommandRunner()
         self.stdout_fn: Optional[Callable] = None
         self.stderr_fn: Optional[Callable] = None
+        self._collect_lock = threading.Lock()
+        self._scons_cache: Optional[SConsCache] = None
+        self._tracer: Optional[BuildTracer] = None
 
     @classmethod
     def name(cls) -> str:
@@ -137,71 +173,158 @@ class MakeTemplates(xappt.BaseTool):
     def collection(cls) -> str:
         return "Godot"
 
-    def _build_platform_template(self, **kwargs):
-        cwd = kwargs['cwd']
+    def _build_platform_template(self, job: BuildJob, *, cwd: str, output_path: str, threads: int,
+                                 journal: BuildJournal) -> List[str]:
         bin_path = os.path.join(cwd, "bin")
-        output_path = kwargs['output_path']
-        targets = kwargs['targets']
-        architectures = kwargs.get('architectures', [])
-        post_target_commands = kwargs.get('post_target_commands', [])
-        command = kwargs['command']
-        build_editor = self.tools.value
+        architectures = job.build_vars.get('architectures', [])
+        post_target_commands = job.build_vars.get('post_target_commands', [])
 
         os.makedirs(output_path, exist_ok=True)
 
         if len(architectures) == 0:
             architectures = [None]
 
-        variables = kwargs.copy()
+        variables = job.build_vars.copy()
+        variables.update({'cwd': cwd, 'output_path': output_path})
         variables['bin_path'] = bin_path
         variables.update(os.environ)
+        variables['jobs'] = threads
+
+        def run_step(step: str, command: Sequence[str], **kwargs) -> List[str]:
+            journal.run_step(f"{job.name}:build:{step}", lambda: self._run_command(command, **kwargs))
+            files = journal.run_step(f"{job.name}:collect:{step}",
+                                     lambda: {"files": self._collect_files(bin_path, output_path)})['files']
+            journal.run_step(f"{job.name}:strip:{step}", lambda: self._strip_files(files, output_path, **variables))
+            return [binary for _, binary in files]
+
+        collected = []
+        if job.target is None:
+            editor_cmd = [c.format_map(variables) for c in job.build_vars['editor']]
+            collected.extend(run_step("editor", editor_cmd, cwd=cwd, watch=self._watch_scons))
+            return collected
+
+        variables['target'] = job.target
+        for arch in architectures:
+            variables['arch'] = arch
+            build_cmd = [c.format_map(variables) for c in job.build_vars['command']]
+            collected.extend(run_step(f"scons-{arch or job.target}", build_cmd, cwd=cwd, watch=self._watch_scons))
+        for i, post_target in enumerate(post_target_commands):
+            post_cmd = [c.format_map(variables) for c in post_target['command']]
+            post_cmd_cwd = post_target.get('cwd', cwd).format_map(variables)
+            collected.extend(run_step(f"post-{i}", post_cmd, cwd=post_cmd_cwd))
+        return collected
+
+    def _span(self, name: str, category: str, **args):
+        """ Time a step of the build, see `BuildTracer.span`. """
+        if self._tracer is None:
+            return contextlib.nullcontext(args)
+        return self._tracer.span(name, category, **args)
 
-        for target in targets:
-            variables['target'] = target
-            for arch in architectures:
-                variables['arch'] = arch
-                build_cmd = [c.format_map(variables) for c in command]
-                self._run_command(build_cmd, cwd=cwd)
-                self._collect_files(bin_path, output_path, **variables)
-            for post_target in post_target_commands:
-                post_cmd = [c.format_map(variables) for c in post_target['command']]
-                post_cmd_cwd = post_target.get('cwd', cwd).format_map(variables)
-                self._run_command(post_cmd, cwd=post_cmd_cwd)
-                self._collect_files(bin_path, output_path, **variables)
-        if build_editor and "editor" in kwargs:
-            editor_command = kwargs['editor']
-            self._run_command(editor_command, cwd=cwd)
-            self._collect_files(bin_path, output_path, **variables)
-
-    def _run_command(self, command: Sequence, *, cwd: Optional[str] = None):
-        silent = self.stdout_fn is not None or self.stderr_fn is not None
-        result = self.cmd.run(command, cwd=cwd, silent=silent,
-                              stdout_fn=self.stdout_fn, stderr_fn=self.stderr_fn).result
+    @staticmethod
+    def _posted(messages: queue.Queue, fn: Callable[[str], None]) -> Callable[[str], None]:
+        """ Returns a callback that has `fn` called with each line on the thread that empties `messages`. """
+        def post(line: str):
+            messages.put(functools.partial(fn, line))
+        return post
+
+    @property
+    def _watch_scons(self) -> Optional[Callable[[str], None]]:
+        return None if self._scons_cache is None else self._scons_cache.watch
+
+    def _run_command(self, command: Sequence, *, cwd: Optional[str] = None,
+                     watch: Optional[Callable[[str], None]] = None):
+        """ Run `command`, asserting that it succeeds. `watch` is given every line the command prints. """
+        silent = self.stdout_fn is not None or self.stderr_fn is not None or watch is not None
+        stdout_fn = self.stdout_fn
+        stderr_fn = self.stderr_fn
+        if watch is not None:
+            echo = self.stdout_fn or print
+
+            def watched(line: str):
+                watch(line)
+                echo(line)
+
+            stdout_fn = watched
+            stderr_fn = self.stderr_fn or functools.partial(print, file=sys.stderr)
+        with self._span(" ".join(command), command_category(command), cwd=cwd) as span:
+            result = self.cmd.run(command, cwd=cwd, silent=silent, stdout_fn=stdout_fn, stderr_fn=stderr_fn).result
+            span['result'] = result
         assert result == 0, f"Command failed with code {result}: '{' '.join(command)}'"
 
-    def _collect_files(self, source: str, destination: str, **kwargs):
-        strip = self.strip.value
-        for binary in self._collect_binaries(source, destination):
-            file_name = os.path.basename(binary)
-            for source_name, target_name in NAME_MAPPING:
-                if file_name == source_name:
-                    new_binary = os.path.join(destination, target_name)
-                    shutil.move(binary, new_binary)
-                    binary = new_binary
-            if strip and "strip_command" in kwargs:
-                strip_bin = kwargs["strip_command"]["bin"].format_map(kwargs)
-                name_match_regex = re.compile(kwargs["strip_command"]['regex'], re.I)
-                backup_path = os.path.join(destination, "backup")
-                os.makedirs(backup_path, exist_ok=True)
-                if name_match_regex.match(file_name) is not None:
-                    unstripped_file_name = os.path.join(backup_path, file_name)
+    def _collect_files(self, source: str, destination: str) -> List[Tuple[str, str]]:
+        """ Move the binaries in `source` to `destination`. Returns the name each binary was built with,
+        and where it was moved to.
+        """
+        collected = []
+        # builds running at the same time collect into the same folder, so names are picked one build at a time
+        with self._collect_lock, self._span(f"collect {source}", "collect") as span:
+            for binary in self._collect_binaries(source, destination):
+                file_name = os.path.basename(binary)
+                for source_name, target_name in NAME_MAPPING:
+                    if file_name == source_name:
+                        new_binary = os.path.join(destination, target_name)
+                        shutil.move(binary, new_binary)
+                        binary = new_binary
+                collected.append((file_name, binary))
+            span['bytes'] = sum(os.path.getsize(binary) for _, binary in collected)
+        return collected
+
+    def _strip_files(self, files: Sequence[Tuple[str, str]], destination: str, **kwargs):
+        if not self.strip.value or "strip_command" not in kwargs:
+            return
+        strip_bin = kwargs["strip_command"]["bin"].format_map(kwargs)
+        name_match_regex = re.compile(kwargs["strip_command"]['regex'], re.I)
+        backup_path = os.path.join(destination, "backup")
+        os.makedirs(backup_path, exist_ok=True)
+        for file_name, binary in files:
+            if name_match_regex.match(file_name) is not None:
+                unstripped_file_name = os.path.join(backup_path, file_name)
+                # a resumed build may have moved the binary already
+                if os.path.isfile(binary):
                     shutil.move(binary, unstripped_file_name)
-                    # self.cmd.run((strip_bin, unstripped_file_name, "-o", binary), silent=False)
-                    self._run_command((strip_bin, unstripped_file_name, "-o", binary))
+                self._run_command((strip_bin, unstripped_file_name, "-o", binary))
+
+    @staticmethod
+    def _is_marked(marker_path: str, run_id: str) -> bool:
+        try:
+            with open(marker_path, "r") as fp:
+                return fp.read().strip() == run_id
+        except OSError:
+            return False
+
+    def _copy_modules(self, module_paths: Sequence[Tuple[str, str]], godot_path: str):
+        modules_path = os.path.join(godot_path, "modules")
+        # build trees are reused and checking out keeps untracked folders, so modules copied in by an earlier
+        # build are removed unless this build selected them too
+        keep = GitMirror.tracked_names(godot_path, "modules") | {dst_folder for _, dst_folder in module_paths}
+        for item in os.scandir(modules_path):  # type: os.DirEntry
+            if item.is_dir() and item.name not in keep:
+                with self._span(f"remove module {item.name}", "modules"):
+                    shutil.rmtree(item.path)
+        for module_src_path, dst_folder in module_paths:
+            module_dst_path = os.path.join(modules_path, dst_folder)
+            with self._span(f"copy module {dst_folder}", "modules"):
+                if os.path.isdir(module_dst_path):
+                    shutil.rmtree(module_dst_path)
+                shutil.copytree(module_src_path, module_dst_path)
+
+    def _restore_files(self, files: Sequence[str], destination: str) -> List[str]:
+        os.makedirs(destination, exist_ok=True)
+        restored = []
+        with self._collect_lock, self._span(f"restore {len(files)} files", "restore") as span:
+            for f in files:
+                # overwrite earlier output, the same as a real build does when it renames a binary into place
+                dst = os.path.join(destination, os.path.basename(f))
+                shutil.copy2(f, dst)
+                restored.append(dst)
+            span['bytes'] = sum(os.path.getsize(f) for f in restored)
+        return restored
 
     @staticmethod
     def _collect_binaries(src_path: str, dst_path: str) -> Generator[str, None, None]:
         collected_files = []
+        if not os.path.isdir(src_path):
+            return  # a tree that nothing has been built in yet has no `bin`
         for item in os.scandir(src_path):  # type: os.DirEntry
             if not item.is_file():
                 continue
@@ -215,7 +338,27 @@ class MakeTemplates(xappt.BaseTool):
         manifest_path = self.manifest_path.value
         project_root = os.path.dirname(manifest_path)
         template_path = os.path.join(project_root, "templates")
+        self._tracer = BuildTracer(os.path.join(template_path, TRACE_NAME))
+        try:
+            self._build_templates(manifest_path, template_path)
+        finally:
+            # a failed build leaves a trace too, whatever it failed on
+            self._tracer.save()
+
+        summary = ""
+        if self._scons_cache is not None:
+            self._scons_cache.evict()
+            summary = f"{self._scons_cache.summary()}\n\n"
+        summary += f"{self._tracer.summary()}\n\nA timeline was saved to {self._tracer.path}\n\n"
+
+        self.interface.progress_end()
+
+        if self.interface.ask(f"Build complete.\n\n{summary}Open build folder?"):
+            open_file(template_path)
 
+        return 0
+
+    def _build_templates(self, manifest_path: str, template_path: str):
         self.interface.progress_start()
 
         self.interface.progress_update("Loading manifest...", 0.0)
@@ -227,55 +370,127 @@ class MakeTemplates(xappt.BaseTool):
         if len(manifest['ENCRYPTION_KEY']):
             self.cmd.env_var_add("SCRIPT_AES256_ENCRYPTION_KEY", manifest['ENCRYPTION_KEY'])
 
-        with xappt.temp_path() as tmp:
-            self.interface.progress_update("Cloning Godot Engine repository...", 0.0)
-            # assert self.cmd.run(("git", "clone", "https://github.com/godotengine/godot.git", "godot-build"),
-            #                     cwd=tmp, silent=False).result == 0
-            self._run_command(("git", "clone", "https://github.com/godotengine/godot.git", "godot-build"), cwd=tmp)
-
-            godot_path = os.path.join(tmp, "godot-build")
-            self.interface.progress_update(f"Fetching...", 0.33)
-            # assert self.cmd.run(("git", "fetch", "--all", "--tags"), cwd=godot_path, silent=False).result == 0
-            self._run_command(("git", "fetch", "--all", "--tags"), cwd=godot_path)
+        cache_path = self.cache_path.value
+        godot_mirror = GitMirror(GODOT_REPOSITORY, cache_path, self._run_command)
+        mirrors = [godot_mirror]
+        artifacts = ArtifactCache(cache_path) if self.reuse_artifacts.value else None
+        if self.scons_cache_limit.value > 0:
+            self._scons_cache = SConsCache(cache_path, limit_mb=self.scons_cache_limit.value)
+            for key, value in self._scons_cache.environment().items():
+                self.cmd.env_var_add(key, value)
+
+        identity = {
+            "manifest": manifest_path,
+            "tag": branch,
+            "encryption_key": hash_secret(manifest['ENCRYPTION_KEY']),
+            "platforms": list(self.platform.value),
+            "modules": list(self.modules.value),
+            "tools": self.tools.value,
+            "strip": self.strip.value,
+        }
+        journal = BuildJournal(journal_path(cache_path, manifest_path), identity, resume=self.resume.value)
+        if self.resume.value and not journal.resumed:
+            self.interface.warning("There is no failed build with the same settings to resume, starting a new build.")
 
-            self.interface.progress_update(f"Checking out branch '{branch}'...", 0.66)
-            # assert self.cmd.run(("git", "checkout", f"tags/{branch}", "-b", branch),
-            #                     cwd=godot_path, silent=False).result == 0
-            self._run_command(("git", "checkout", f"tags/{branch}", "-b", branch), cwd=godot_path)
+        with xappt.temp_path() as tmp:
+            self.interface.progress_update(f"Fetching tag '{branch}' into the Godot Engine mirror...", 0.0)
+            # the commit is recorded, so a resumed build checks out exactly the same sources
+            godot_commit = journal.run_step(
+                "fetch:godot", lambda: {"commit": godot_mirror.resolve(godot_mirror.fetch_tag(branch))})['commit']
+
+            base_inputs = {
+                "godot": godot_commit,
+                "modules": {},
+                "encryption_key": hash_secret(manifest['ENCRYPTION_KEY']),
+                "strip": self.strip.value,
+            }
 
             selected_modules = self.modules.value
+            module_paths = []
             for i, module in enumerate(selected_modules):
                 progress = (i / len(selected_modules))
-                self.interface.progress_update(f"Cloning module '{module}'...", progress)
+                self.interface.progress_update(f"Fetching module '{module}'...", progress)
                 module_dict = GODOT_MODULES[module]
-                # assert self.cmd.run(("git", "clone", module_dict['repository'], module),
-                #                     cwd=tmp, silent=False).result == 0
-                self._run_command(("git", "clone", module_dict['repository'], module), cwd=tmp)
-                module_src_path = os.path.abspath(os.path.join(tmp, module, module_dict['src-folder']))
-                module_dst_path = os.path.abspath(os.path.join(godot_path, "modules", module_dict['dst-folder']))
-                shutil.copytree(module_src_path, module_dst_path)
-
-            selected_platforms = self.platform.value
-            for i, platform in enumerate(selected_platforms):
-                progress = (i / len(selected_platforms))
-                self.interface.progress_update(f"Building for platform '{platform}'...", progress)
-                build_vars = BUILD_COMMANDS[platform]
-                if isinstance(build_vars, dict):
-                    build_vars = [build_vars]
-                for var_set in build_vars:
-                    argument_dict = var_set.copy()
-                    argument_dict.update({
-                        'cwd': godot_path,
-                        'output_path': template_path,
-                    })
-                    self._build_platform_template(**argument_dict)
-
-        self.interface.progress_end()
-
-        if self.interface.ask("Build complete.\n\nOpen build folder?"):
-            open_file(template_path)
-
-        return 0
+                module_mirror = GitMirror(module_dict['repository'], cache_path, self._run_command)
+                mirrors.append(module_mirror)
+                module_path = os.path.join(tmp, "modules", module)
+                module_commit = journal.run_step(
+                    f"fetch:{module}", lambda: {"commit": module_mirror.resolve(module_mirror.fetch_head())})['commit']
+                module_mirror.add_worktree(module_commit, module_path)
+                base_inputs['modules'][module] = dict(module_dict, commit=module_commit)
+                module_paths.append((os.path.abspath(os.path.join(module_path, module_dict['src-folder'])),
+                                     module_dict['dst-folder']))
+
+            jobs = plan_jobs(BUILD_COMMANDS, self.platform.value, editor=self.tools.value)
+            workers, threads = split_cores(len(jobs), self.parallel_builds.value)
+            # jobs that didn't need to run scons, and why
+            skipped_jobs = {}
+
+            def build(job: BuildJob) -> List[str]:
+                job_step = f"{job.name}:done"
+                if journal.done(job_step):
+                    skipped_jobs[job.name] = "Already built"
+                    return journal.data(job_step)['files']
+                with self._span(job.name, "job"):
+                    collected = build_job(job)
+                journal.record(job_step, files=collected)
+                return collected
+
+            def build_job(job: BuildJob) -> List[str]:
+                inputs = dict(base_inputs, platform=job.platform, target=job.target, build_vars=job.build_vars)
+                key = artifact_key(inputs)
+                if artifacts is not None:
+                    cached_files = artifacts.lookup(key)
+                    if cached_files is not None:
+                        skipped_jobs[job.name] = "Restored"
+                        return self._restore_files(cached_files, template_path)
+
+                # every build gets its own source tree, so builds running at the same time don't share `bin`,
+                # and the tree is kept in the cache so the next build of the same job is incremental
+                godot_path = os.path.join(cache_path, "builds", job.name)
+                with file_lock(f"{godot_path}.lock"):
+                    # build trees are shared by every project, so steps from an earlier attempt can only be
+                    # trusted if no other build has used the tree since
+                    marker_path = os.path.join(godot_path, BUILD_MARKER)
+                    if journal.resumed and not self._is_marked(marker_path, journal.run_id):
+                        journal.discard(f"{job.name}:")
+
+                    def checkout():
+                        with self._span(f"checkout {job.name}", "checkout"):
+                            godot_mirror.checkout_worktree(godot_commit, godot_path)
+                        with open(marker_path, "w") as fp:
+                            fp.write(journal.run_id)
+
+                    journal.run_step(f"{job.name}:checkout", checkout)
+                    journal.run_step(f"{job.name}:modules", lambda: self._copy_modules(module_paths, godot_path))
+                    collected = self._build_platform_template(job, cwd=godot_path, output_path=template_path,
+                                                              threads=threads, journal=journal)
+                if artifacts is not None:
+                    with self._span(f"store {job.name}", "store") as span:
+                        artifacts.store(key, collected, inputs)
+                        span['bytes'] = sum(os.path.getsize(f) for f in collected)
+                return collected
+
+            def on_done(job: BuildJob, done: int):
+                action = skipped_jobs.get(job.name, "Built")
+                self.interface.progress_update(f"{action} '{job.name}' ({done}/{len(jobs)})", done / len(jobs))
+
+            self.interface.progress_update(f"Building {len(jobs)} targets, {workers} at a time with "
+                                           f"{threads} jobs each...", 0.0)
+            # the console can only be written to from this thread, so builds post their output here instead
+            messages = queue.Queue()
+            console = self.stdout_fn, self.stderr_fn
+            self.stdout_fn, self.stderr_fn = (None if fn is None else self._posted(messages, fn) for fn in console)
+            try:
+                run_jobs(jobs, build, workers=workers, on_done=on_done, messages=messages)
+            finally:
+                self.stdout_fn, self.stderr_fn = console
+
+        # the module worktrees were removed along with the temporary folder
+        for mirror in mirrors:
+            mirror.prune()
+
+        journal.finish()
 
     def check_prerequisites(self):
         if os.name != "posix":
@@ -316,6 +531,7 @@ class MakeTemplates(xappt.BaseTool):
         try:
             return self.run_build()
         except AssertionError as e:
-            self.interface.error(str(e))
+            self.interface.error(f"{e}\n\nRun the build again with `resume` enabled to continue from the step that "
+                                 f"failed.")
             self.interface.progress_end()
             return 1
@@ -4,16 +4,14 @@ import os
 import pathlib
 import shutil
 
-# noinspection PyPackageRequirements
-from Crypto.Cipher import AES
-# noinspection PyPackageRequirements
-from Crypto.Random import get_random_bytes
-
 import xappt
 
 from xappt_plugins.plugins.godot import templates
 from xappt_plugins.validators import *
-from xappt_plugins.utilities import open_file
+from xappt_plugins.utilities import lazy_import, open_file
+
+AES = lazy_import("Crypto.Cipher.AES")
+Random = lazy_import("Crypto.Random")
 
 logger = logging.getLogger("xappt")
 
@@ -100,7 +98,7 @@ class NewProject(xappt.BaseTool):
 
     @staticmethod
     def _generate_aes_256_cbc_key():
-        key = get_random_bytes(32)
+        key = Random.get_random_bytes(32)
         aes_256_cbc = AES.new(key, AES.MODE_CBC)
         return aes_256_cbc.encrypt(key).hex().upper()
 
@@ -0,0 +1,81 @@
+import os
+import re
+import threading
+
+from typing import Dict, List, Tuple
+
+# scons prints this for every target it copies out of the cache instead of building
+RETRIEVED_PATTERN = re.compile(r"^Retrieved `.+' from cache")
+# Godot prints this for every source file it compiles, unless `verbose=yes`
+COMPILED_PATTERN = re.compile(r"^Compiling ")
+# Godot only colors its output on a tty, but strip colors in case it's forced on
+ANSI_PATTERN = re.compile(r"\x1b\[[0-9;]*m")
+
+MEBIBYTE = 1024 * 1024
+
+
+class SConsCache:
+    """ A scons cache directory in `cache_path` shared by every build, so unchanged object files are copied from
+    the cache rather than compiled. Godot enables the cache when `SCONS_CACHE` is set, and trims it to
+    `SCONS_CACHE_LIMIT` MiB itself. The least recently used files are also evicted here after a build, since
+    several builds writing to it at the same time can push it over the limit.
+
+    `watch` is given every line scons prints, to count cache hits and misses.
+    """
+    def __init__(self, cache_path: str, *, limit_mb: int):
+        self.path = os.path.join(cache_path, "scons")
+        self.limit_mb = limit_mb
+        self.retrieved = 0
+        self.compiled = 0
+        self._lock = threading.Lock()
+
+    def environment(self) -> Dict[str, str]:
+        return {"SCONS_CACHE": self.path, "SCONS_CACHE_LIMIT": str(self.limit_mb)}
+
+    def watch(self, line: str):
+        line = ANSI_PATTERN.sub("", line)
+        if RETRIEVED_PATTERN.match(line) is not None:
+            with self._lock:
+                self.retrieved += 1
+        elif COMPILED_PATTERN.match(line) is not None:
+            with self._lock:
+                self.compiled += 1
+
+    def _entries(self) -> List[Tuple[float, int, str]]:
+        entries = []
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue  # removed by a build that is trimming the cache
+                entries.append((max(stat.st_atime, stat.st_mtime), stat.st_size, path))
+        return entries
+
+    def size(self) -> Tuple[int, int]:
+        """ Returns the total size of the cache in bytes, and the number of files in it. """
+        entries = self._entries()
+        return sum(size for _, size, _ in entries), len(entries)
+
+    def evict(self) -> int:
+        """ Remove the least recently used files until the cache is within its limit. Returns the bytes removed. """
+        entries = sorted(self._entries())
+        excess = sum(size for _, size, _ in entries) - self.limit_mb * MEBIBYTE
+        removed = 0
+        for _, size, path in entries:
+            if removed >= excess:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            removed += size
+        return removed
+
+    def summary(self) -> str:
+        total = self.retrieved + self.compiled
+        size, count = self.size()
+        hit_rate = f"{self.retrieved / total:.0%}" if total else "n/a"
+        return (f"SCons cache: {self.retrieved} hits, {self.compiled} files compiled ({hit_rate} hit rate), "
+                f"{count} files using {size / MEBIBYTE:.0f} of {self.limit_mb} MiB")
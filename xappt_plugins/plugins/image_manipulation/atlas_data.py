@@ -0,0 +1,81 @@
+import json
+import os
+
+from collections import namedtuple
+from typing import Callable, Dict, Sequence, Tuple
+
+import xappt_plugins.__version__
+
+# `placement` is where the frame's pixels are in the atlas, `offset` is where those pixels belong
+# within the original frame, which was `source_size` pixels in size.
+AtlasFrame = namedtuple("AtlasFrame", ["name", "placement", "source_size", "offset"])
+
+
+def _rect(x: int, y: int, w: int, h: int) -> Dict:
+    return {"x": x, "y": y, "w": w, "h": h}
+
+
+def _meta(image_name: str, image_size: Tuple[int, int], image_mode: str) -> Dict:
+    return {
+        "app": "xappt_plugins",
+        "version": xappt_plugins.__version__.__version__,
+        "image": image_name,
+        "format": image_mode,
+        "size": {"w": image_size[0], "h": image_size[1]},
+        "scale": "1",
+    }
+
+
+def build_json(image_name: str, image_size: Tuple[int, int], image_mode: str,
+               frames: Sequence[AtlasFrame]) -> Dict:
+    """ A TexturePacker style "JSON (Hash)" description. """
+    frame_dict = {}
+    for frame in frames:
+        placement = frame.placement
+        trimmed = (placement.width, placement.height) != tuple(frame.source_size)
+        frame_dict[frame.name] = {
+            "frame": _rect(*placement),
+            "rotated": False,
+            "trimmed": trimmed,
+            "spriteSourceSize": _rect(frame.offset[0], frame.offset[1], placement.width, placement.height),
+            "sourceSize": {"w": frame.source_size[0], "h": frame.source_size[1]},
+        }
+    return {"frames": frame_dict, "meta": _meta(image_name, image_size, image_mode)}
+
+
+def build_tpsheet(image_name: str, image_size: Tuple[int, int], image_mode: str,
+                  frames: Sequence[AtlasFrame]) -> Dict:
+    """ A `.tpsheet` description, as read by the TexturePacker importer for Godot. """
+    sprites = []
+    for frame in frames:
+        placement = frame.placement
+        sprites.append({
+            "filename": frame.name,
+            "region": _rect(*placement),
+            "margin": _rect(frame.offset[0], frame.offset[1],
+                            frame.source_size[0] - placement.width, frame.source_size[1] - placement.height),
+        })
+    return {
+        "textures": [{
+            "image": image_name,
+            "size": {"w": image_size[0], "h": image_size[1]},
+            "sprites": sprites,
+        }],
+        "meta": _meta(image_name, image_size, image_mode),
+    }
+
+
+ATLAS_FORMATS: Dict[str, Tuple[str, Callable[..., Dict]]] = {
+    "json": (".json", build_json),
+    "godot": (".tpsheet", build_tpsheet),
+}
+
+
+def write_atlas_data(atlas_format: str, output_file: str, image_size: Tuple[int, int], image_mode: str,
+                     frames: Sequence[AtlasFrame]) -> str:
+    extension, build_fn = ATLAS_FORMATS[atlas_format]
+    data_file = f"{os.path.splitext(output_file)[0]}{extension}"
+    data = build_fn(os.path.basename(output_file), image_size, image_mode, frames)
+    with open(data_file, "w", newline="\n") as fp:
+        json.dump(data, fp, indent=2)
+    return data_file
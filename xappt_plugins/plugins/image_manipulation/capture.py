@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import datetime
+import json
+import logging
+import queue
+import threading
+import time
+
+from collections import namedtuple
+from typing import Callable, List, Optional, Sequence, Tuple, Union
+
+from xappt_plugins.utilities import lazy_import
+
+Image = lazy_import("PIL.Image")
+ImageChops = lazy_import("PIL.ImageChops")
+
+logger = logging.getLogger("xappt")
+
+# `captured` frames were queued for encoding, `skipped` frames were not saved because they had not changed,
+# `dropped` frames were grabbed while the queue was full, `missed` counts deadlines that had already passed
+# by the time the previous grab finished
+CaptureStats = namedtuple("CaptureStats", ["captured", "saved", "skipped", "dropped", "missed"])
+
+# frames are compared as thumbnails of DIFF_BLOCKS x DIFF_BLOCKS blocks
+DIFF_BLOCKS = 64
+
+SaveFunction = Callable[[str, "Image.Image", float], bool]
+
+Rect = Tuple[int, int, int, int]
+
+
+def save_frame(path: str, image: Image.Image, _: float) -> bool:
+    image.save(path)
+    return True
+
+
+def parse_rects(value: str) -> List[Rect]:
+    """ Parse rects in the `x1,y1,x2,y2;x1,y1,x2,y2` format produced by `ValidateRectListString`. """
+    return [tuple(int(v) for v in rect.split(",")) for rect in value.split(";") if len(rect.strip())]
+
+
+def grab_regions(grab: Callable[[Optional[Rect]], Image.Image], regions: Sequence[Optional[Rect]], *,
+                 scale: float = 1.0) -> Image.Image:
+    """ Grab each of `regions` and place them side by side, top aligned, in a single frame.
+    Regions are scaled as soon as they are grabbed, so only the reduced pixels are tiled, queued and encoded.
+    """
+    images = []
+    for region in regions:
+        image = grab(region)
+        if scale < 1.0:
+            size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+            scaled = image.resize(size, Image.BILINEAR, reducing_gap=2.0)
+            image.close()
+            image = scaled
+        images.append(image)
+    if len(images) == 1:
+        return images[0]
+    frame = Image.new(images[0].mode, (sum(image.width for image in images), max(image.height for image in images)))
+    left = 0
+    for image in images:
+        frame.paste(image, (left, 0))
+        left += image.width
+        image.close()
+    return frame
+
+
+class FrameDiffer:
+    """ Decides whether a frame has changed enough since the last kept frame to be worth saving.
+    Frames are reduced to small grayscale thumbnails, so each thumbnail pixel is the average of
+    a block of the screen, and a frame has changed when any block differs by more than `threshold`.
+    Comparing against the last kept frame rather than the last grab means slow changes still add up.
+    """
+    def __init__(self, *, threshold: int):
+        self.threshold = threshold
+        self._previous: Optional[Image.Image] = None
+
+    def changed(self, image: Image.Image) -> bool:
+        thumbnail = image.convert("L").resize((DIFF_BLOCKS, DIFF_BLOCKS), Image.BOX)
+        if self._previous is not None:
+            _, largest = ImageChops.difference(thumbnail, self._previous).getextrema()
+            if largest <= self.threshold:
+                return False
+        self._previous = thumbnail
+        return True
+
+
+class CaptureIndex:
+    """ A sidecar file with one JSON line per grab, recording when it was taken, the file that holds
+    its pixels, and whether that file was saved for this grab or is a reference to an earlier one.
+    Frames saved inside an archive or video also record their `entry` in that file.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._fp = open(path, "a", newline="\n")
+
+    def record(self, timestamp: float, file_name: Optional[str], saved: bool, entry: Union[str, int, None] = None):
+        line = {"time": datetime.datetime.fromtimestamp(timestamp).isoformat(), "file": file_name, "saved": saved}
+        if entry is not None:
+            line['entry'] = entry
+        self._fp.write(json.dumps(line) + "\n")
+        # flushed per line so an interrupted recording still has a usable index
+        self._fp.flush()
+
+    def close(self):
+        self._fp.close()
+
+
+class CaptureEngine:
+    """ Grab a frame every `interval` seconds and save it on a background thread.
+
+    Grabs are scheduled against fixed deadlines on a monotonic clock, so the time spent grabbing
+    and encoding never accumulates into drift. Deadlines that pass while a grab is still running
+    are skipped rather than caught up on. At most `queue_depth` frames wait for the encoder, frames
+    grabbed while the queue is full are dropped so memory use stays bounded.
+
+    `save` is called on the encoder thread with the path, image and grab time of each frame, and
+    returns `False` if it chose not to write the frame.
+    """
+    def __init__(self, grab: Callable[[], Image.Image], *, interval: float, queue_depth: int = 4,
+                 save: SaveFunction = save_frame):
+        self.grab = grab
+        self.save = save
+        self.interval = interval
+        self._queue = queue.Queue(maxsize=queue_depth)
+        self._stop = threading.Event()
+        self._saved = 0
+        self._skipped = 0
+        self.error: Optional[Exception] = None
+
+    @property
+    def stopped(self) -> bool:
+        return self._stop.is_set()
+
+    def stop(self):
+        """ Safe to call from any thread, the capture loop wakes up immediately. """
+        self._stop.set()
+
+    def _encode_frames(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self.error is not None:
+                continue  # keep draining so the capture loop never blocks on a full queue
+            path, image, timestamp = item
+            try:
+                if self.save(path, image, timestamp):
+                    self._saved += 1
+                else:
+                    self._skipped += 1
+            except Exception as e:
+                self.error = e
+                self.stop()
+            finally:
+                image.close()
+
+    def _wait_until(self, deadline: float, on_wait: Optional[Callable[[float], None]], tick: Optional[float]) -> bool:
+        """ Sleep until `deadline`, waking every `tick` seconds to report progress through `on_wait`.
+        Returns `False` if the engine was stopped while waiting.
+        """
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return not self.stopped
+            if on_wait is not None:
+                on_wait(1.0 - (remaining / self.interval))
+            timeout = remaining if tick is None else min(remaining, tick)
+            if self._stop.wait(timeout):
+                return False
+
+    def run(self, frame_path: Callable[[], str], *, on_captured: Optional[Callable[[str], None]] = None,
+            on_wait: Optional[Callable[[float], None]] = None, tick: Optional[float] = None) -> CaptureStats:
+        """ Capture until `stop` is called. `frame_path` names each frame as it is grabbed. """
+        encoder = threading.Thread(target=self._encode_frames, name="capture-encoder", daemon=True)
+        encoder.start()
+        captured = dropped = missed = 0
+        start = time.monotonic()
+        frame = 0
+        try:
+            while self._wait_until(start + frame * self.interval, on_wait, tick):
+                path = frame_path()
+                timestamp = time.time()
+                image = self.grab()
+                try:
+                    self._queue.put_nowait((path, image, timestamp))
+                    captured += 1
+                except queue.Full:
+                    dropped += 1
+                    logger.warning(f"Encoder is falling behind, dropped '{path}'")
+                    image.close()
+                if on_captured is not None:
+                    on_captured(path)
+                next_frame = int((time.monotonic() - start) / self.interval) + 1
+                missed += max(0, next_frame - frame - 1)
+                frame = max(frame + 1, next_frame)
+        finally:
+            self._queue.put(None)
+            encoder.join()
+        return CaptureStats(captured, self._saved, self._skipped, dropped, missed)
@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import io
+import logging
+import os
+import shutil
+import subprocess
+import zipfile
+
+from collections import namedtuple
+from typing import Optional, Tuple
+
+from xappt_plugins.utilities import lazy_import
+
+Image = lazy_import("PIL.Image")
+
+logger = logging.getLogger("xappt")
+
+# where a frame ended up: the file that holds it, and the archive member name or video frame number inside it
+FrameLocation = namedtuple("FrameLocation", ["file", "entry"])
+
+CONTAINER_NONE = "none"
+CONTAINER_ZIP = "zip"
+CONTAINER_VIDEO = "video"
+CONTAINERS = (CONTAINER_NONE, CONTAINER_ZIP, CONTAINER_VIDEO)
+
+# playback rate of video chunks, each captured frame becomes one video frame
+VIDEO_FPS = 30
+# matroska stays readable up to the last complete frame if the recording is interrupted
+VIDEO_EXTENSION = ".mkv"
+
+
+class FileWriter:
+    """ Save every frame as its own image file. """
+    def write(self, path: str, image: Image.Image) -> FrameLocation:
+        image.save(path)
+        return FrameLocation(os.path.basename(path), None)
+
+    def close(self):
+        pass
+
+
+class ZipWriter:
+    """ Append frames to zip archives, starting a new archive every `frames_per_file` frames.
+    Frames are encoded exactly as they would be saved to disk, and stored without compression
+    since JPEG and PNG data doesn't get any smaller. Each archive is named after its first frame.
+    """
+    def __init__(self, *, frames_per_file: int):
+        self.frames_per_file = frames_per_file
+        self._archive: Optional[zipfile.ZipFile] = None
+        self._file_name = ""
+        self._count = 0
+
+    def _rotate(self, path: str):
+        self.close()
+        self._file_name = f"{os.path.splitext(os.path.basename(path))[0]}.zip"
+        self._archive = zipfile.ZipFile(os.path.join(os.path.dirname(path), self._file_name), "w",
+                                        compression=zipfile.ZIP_STORED)
+        self._count = 0
+
+    def write(self, path: str, image: Image.Image) -> FrameLocation:
+        if self._archive is None or self._count >= self.frames_per_file:
+            self._rotate(path)
+        name = os.path.basename(path)
+        buffer = io.BytesIO()
+        image.save(buffer, format=Image.registered_extensions()[os.path.splitext(name)[1].lower()])
+        self._archive.writestr(name, buffer.getvalue())
+        self._count += 1
+        return FrameLocation(self._file_name, name)
+
+    def close(self):
+        if self._archive is not None:
+            self._archive.close()
+            self._archive = None
+
+
+class VideoWriter:
+    """ Pipe frames to ffmpeg as raw RGB, starting a new video every `frames_per_file` frames, or
+    whenever the frame size changes. Each video is named after its first frame.
+    """
+    def __init__(self, ffmpeg: str, *, frames_per_file: int, fps: int = VIDEO_FPS):
+        self.ffmpeg = ffmpeg
+        self.frames_per_file = frames_per_file
+        self.fps = fps
+        self._process: Optional[subprocess.Popen] = None
+        self._size: Tuple[int, int] = (0, 0)
+        self._file_name = ""
+        self._count = 0
+
+    def _rotate(self, path: str, size: Tuple[int, int]):
+        self.close()
+        self._file_name = f"{os.path.splitext(os.path.basename(path))[0]}{VIDEO_EXTENSION}"
+        self._size = size
+        self._count = 0
+        command = (
+            self.ffmpeg, "-hide_banner", "-loglevel", "error", "-y",
+            "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{size[0]}x{size[1]}", "-r", str(self.fps), "-i", "-",
+            # yuv420p is the most widely playable, but needs even dimensions
+            "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-pix_fmt", "yuv420p",
+            os.path.join(os.path.dirname(path), self._file_name),
+        )
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                         stderr=subprocess.PIPE)
+
+    def write(self, path: str, image: Image.Image) -> FrameLocation:
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        if self._process is None or self._count >= self.frames_per_file or image.size != self._size:
+            self._rotate(path, image.size)
+        try:
+            self._process.stdin.write(image.tobytes())
+        except BrokenPipeError:
+            self.close()  # raises with ffmpeg's own error message
+            raise
+        location = FrameLocation(self._file_name, self._count)
+        self._count += 1
+        return location
+
+    def close(self):
+        if self._process is None:
+            return
+        process, self._process = self._process, None
+        _, stderr = process.communicate()
+        if process.returncode != 0:
+            raise RuntimeError(f"ffmpeg could not write '{self._file_name}': {stderr.decode(errors='replace').strip()}")
+
+
+def create_writer(container: str, *, frames_per_file: int):
+    """ Create the writer for `container`. Video falls back to zip archives when ffmpeg isn't installed. """
+    if container == CONTAINER_VIDEO:
+        ffmpeg = shutil.which("ffmpeg")
+        if ffmpeg is not None:
+            return VideoWriter(ffmpeg, frames_per_file=frames_per_file)
+        logger.warning("ffmpeg was not found, frames will be saved to zip archives instead")
+        container = CONTAINER_ZIP
+    if container == CONTAINER_ZIP:
+        return ZipWriter(frames_per_file=frames_per_file)
+    return FileWriter()
@@ -0,0 +1,202 @@
+import math
+
+from collections import namedtuple
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from xappt_plugins.utilities import lazy_import
+
+iterutils = lazy_import("boltons.iterutils")
+
+PO2 = [2 ** (x + 1) for x in range(16)]
+
+Placement = namedtuple("Placement", ["x", "y", "width", "height"])
+AtlasLayout = namedtuple("AtlasLayout", ["size", "placements"])
+
+LayoutFunction = Callable[..., AtlasLayout]
+
+LAYOUTS: Dict[str, LayoutFunction] = {}
+UNIFORM_LAYOUTS = set()
+
+
+def register_layout(name: str, *, uniform: bool = False):
+    """ Register a layout function under `name`. Layout functions receive the frame sizes and
+    the keyword arguments `columns` and `force_po2`, and return an `AtlasLayout` with one
+    `Placement` per frame, in frame order. Set `uniform` for layouts that require all frames
+    to be the same size.
+    """
+    def register(func: LayoutFunction) -> LayoutFunction:
+        LAYOUTS[name] = func
+        if uniform:
+            UNIFORM_LAYOUTS.add(name)
+        return func
+    return register
+
+
+def get_layout(name: str) -> LayoutFunction:
+    try:
+        return LAYOUTS[name]
+    except KeyError:
+        raise ValueError(f"Unknown layout '{name}'")
+
+
+def get_matching_po2(n: int) -> int:
+    for lower, upper in iterutils.pairwise_iter(PO2):
+        if n == lower:
+            return n
+        if n == upper:
+            return n
+        if lower < n < upper:
+            return upper
+    raise ValueError(f"Could not find power of 2 for '{n}'")
+
+
+def _uniform_size(sizes: Sequence[Tuple[int, int]], layout_name: str) -> Tuple[int, int]:
+    tile_size = tuple(sizes[0])
+    for size in sizes:
+        if tuple(size) != tile_size:
+            raise ValueError(f"All frames must be the same size for the '{layout_name}' layout, "
+                             f"found {size[0]}x{size[1]} and {tile_size[0]}x{tile_size[1]}")
+    return tile_size
+
+
+def _grid(frame_count: int, tile_size: Tuple[int, int], columns: int, force_po2: bool) -> AtlasLayout:
+    tile_w, tile_h = tile_size
+    rows = int(math.ceil(frame_count / float(columns)))
+    placements = []
+    for index in range(frame_count):
+        row, column = divmod(index, columns)
+        placements.append(Placement(column * tile_w, row * tile_h, tile_w, tile_h))
+    if force_po2:
+        size = (get_matching_po2(tile_w * columns), get_matching_po2(tile_h * rows))
+    else:
+        size = (tile_w * columns, tile_h * rows)
+    return AtlasLayout(size, placements)
+
+
+@register_layout("grid", uniform=True)
+def grid_layout(sizes: Sequence[Tuple[int, int]], **kwargs) -> AtlasLayout:
+    tile_size = _uniform_size(sizes, "grid")
+    return _grid(len(sizes), tile_size, kwargs['columns'], kwargs.get('force_po2', False))
+
+
+@register_layout("square", uniform=True)
+def square_layout(sizes: Sequence[Tuple[int, int]], **kwargs) -> AtlasLayout:
+    """ A grid with the number of columns chosen to make the output as close to square as possible. """
+    tile_w, tile_h = _uniform_size(sizes, "square")
+    frame_count = len(sizes)
+    best_columns = 1
+    best_key = None
+    for columns in range(1, frame_count + 1):
+        rows = int(math.ceil(frame_count / float(columns)))
+        width, height = tile_w * columns, tile_h * rows
+        key = (max(width, height), width * height)
+        if best_key is None or key < best_key:
+            best_key = key
+            best_columns = columns
+    return _grid(frame_count, (tile_w, tile_h), best_columns, kwargs.get('force_po2', False))
+
+
+@register_layout("po2", uniform=True)
+def po2_layout(sizes: Sequence[Tuple[int, int]], **_) -> AtlasLayout:
+    """ A grid with the number of columns chosen to give the smallest power of two output. """
+    tile_w, tile_h = _uniform_size(sizes, "po2")
+    frame_count = len(sizes)
+    best_columns = 1
+    best_key = None
+    for columns in range(1, frame_count + 1):
+        rows = int(math.ceil(frame_count / float(columns)))
+        try:
+            width, height = get_matching_po2(tile_w * columns), get_matching_po2(tile_h * rows)
+        except ValueError:
+            continue  # too wide or too tall for the largest power of two
+        key = (width * height, max(width, height))
+        if best_key is None or key < best_key:
+            best_key = key
+            best_columns = columns
+    if best_key is None:
+        raise ValueError(f"{frame_count} frames of {tile_w}x{tile_h} don't fit in a power of two atlas "
+                         f"of up to {PO2[-1]}x{PO2[-1]}")
+    return _grid(frame_count, (tile_w, tile_h), best_columns, True)
+
+
+def _skyline_pack(sizes: Sequence[Tuple[int, int]], width: int) -> Optional[AtlasLayout]:
+    """ Pack `sizes` into a strip `width` pixels wide using a bottom-left skyline packer.
+    The skyline is a list of contiguous `(x, y, width)` segments covering the strip.
+    """
+    skyline = [(0, 0, width)]
+    placements: List[Optional[Placement]] = [None] * len(sizes)
+    # placing the tallest frames first keeps the skyline flat
+    order = sorted(range(len(sizes)), key=lambda i: (sizes[i][1], sizes[i][0]), reverse=True)
+    for index in order:
+        frame_w, frame_h = sizes[index]
+        if frame_w > width:
+            return None
+        best = None
+        for start, (x, _, _) in enumerate(skyline):
+            if x + frame_w > width:
+                break
+            y = 0
+            covered = 0
+            segment = start
+            while covered < frame_w:
+                y = max(y, skyline[segment][1])
+                covered += skyline[segment][2]
+                segment += 1
+            key = (y + frame_h, x)
+            if best is None or key < best[0]:
+                best = (key, start, x, y)
+        _, start, x, y = best
+        placements[index] = Placement(x, y, frame_w, frame_h)
+
+        end = x + frame_w
+        updated = skyline[:start] + [(x, y + frame_h, frame_w)]
+        for seg_x, seg_y, seg_w in skyline[start:]:
+            if seg_x + seg_w <= end:
+                continue
+            if seg_x < end:
+                updated.append((end, seg_y, seg_x + seg_w - end))
+            else:
+                updated.append((seg_x, seg_y, seg_w))
+        skyline = []
+        for segment in updated:
+            if len(skyline) and skyline[-1][1] == segment[1]:
+                skyline[-1] = (skyline[-1][0], skyline[-1][1], skyline[-1][2] + segment[2])
+            else:
+                skyline.append(segment)
+
+    used_w = max(p.x + p.width for p in placements)
+    used_h = max(p.y + p.height for p in placements)
+    return AtlasLayout((used_w, used_h), placements)
+
+
+@register_layout("packed")
+def packed_layout(sizes: Sequence[Tuple[int, int]], **kwargs) -> AtlasLayout:
+    """ Pack frames of any size, trying several strip widths and keeping the smallest result. """
+    force_po2 = kwargs.get('force_po2', False)
+    max_w = max(w for w, _ in sizes)
+    total_w = sum(w for w, _ in sizes)
+    area = sum(w * h for w, h in sizes)
+    side = int(math.ceil(math.sqrt(area)))
+    candidates = {max_w, total_w}
+    candidates.update(int(side * factor) for factor in (1.0, 1.1, 1.25, 1.5, 2.0))
+    candidates.update(p for p in PO2 if max_w <= p <= total_w)
+
+    best_layout = None
+    best_key = None
+    for width in sorted(c for c in candidates if max_w <= c <= total_w):
+        layout = _skyline_pack(sizes, width)
+        if layout is None:
+            continue
+        if force_po2:
+            try:
+                layout = AtlasLayout((get_matching_po2(layout.size[0]), get_matching_po2(layout.size[1])),
+                                     layout.placements)
+            except ValueError:
+                continue  # too wide or too tall for the largest power of two
+        key = (layout.size[0] * layout.size[1], max(layout.size))
+        if best_key is None or key < best_key:
+            best_key = key
+            best_layout = layout
+    if best_layout is None:
+        raise ValueError(f"{len(sizes)} frames don't fit in a power of two atlas of up to {PO2[-1]}x{PO2[-1]}")
+    return best_layout
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+from typing import Generator, Optional, Tuple, Union
+
+from xappt_plugins.utilities import lazy_import, module_available
+
+Image = lazy_import("PIL.Image")
+
+# numpy is optional, everything in here falls back to Pillow without it
+HAS_NUMPY = module_available("numpy")
+numpy = lazy_import("numpy") if HAS_NUMPY else None
+
+# canvases keep RGB with a padding channel, which is how Pillow lays RGB out in memory, so the
+# array can be wrapped by Image.frombuffer instead of copied
+CANVAS_MODES = {"RGB": "RGBX"}
+
+
+def mode_channels(mode: str) -> int:
+    return Image.getmodebands(mode)
+
+
+def array_shape(mode: str, size: Tuple[int, int]) -> Tuple[int, ...]:
+    width, height = size
+    channels = mode_channels(mode)
+    if channels == 1:
+        return height, width
+    return height, width, channels
+
+
+def to_array(img: Image.Image) -> "numpy.ndarray":
+    return numpy.asarray(img)
+
+
+def from_array(array: "numpy.ndarray") -> Image.Image:
+    """ The mode is picked from the dtype and shape of `array`, `(height, width, 3)` uint8 becomes RGB and
+    `(height, width, 4)` uint8 becomes RGBA.
+    """
+    return Image.fromarray(array)
+
+
+def tile_stack(array: "numpy.ndarray", tile_size: int) -> "numpy.ndarray":
+    """ View an `(height, width, ...)` array as a `(rows, columns, tile_size, tile_size, ...)` stack of tiles.
+    No pixels are copied.
+    """
+    height, width = array.shape[:2]
+    rows, cols = height // tile_size, width // tile_size
+    stack = array.reshape((rows, tile_size, cols, tile_size) + array.shape[2:])
+    return stack.swapaxes(1, 2)
+
+
+def split_tiles(source: Union[Image.Image, "numpy.ndarray"], tile_size: int) \
+        -> Generator[Tuple[int, Image.Image], None, None]:
+    """ Yield `(tile_index, tile)` pairs in row-major order, starting at 1.
+    `source` can be a Pillow image, or an array laid out as `from_array` expects. Pillow images are
+    cropped directly, since converting them to an array would copy every pixel first.
+    """
+    if HAS_NUMPY and isinstance(source, numpy.ndarray):
+        stack = tile_stack(source, tile_size)
+        rows, cols = stack.shape[:2]
+        for y in range(rows):
+            for x in range(cols):
+                yield (y * cols) + x + 1, from_array(numpy.ascontiguousarray(stack[y, x]))
+        return
+
+    cols = source.width // tile_size
+    rows = source.height // tile_size
+    for y in range(rows):
+        top = y * tile_size
+        for x in range(cols):
+            left = x * tile_size
+            yield (y * cols) + x + 1, source.crop((left, top, left + tile_size, top + tile_size))
+
+
+class PillowCanvas:
+    def __init__(self, mode: str, size: Tuple[int, int], base: Optional[Image.Image] = None):
+        self.mode = mode
+        self.size = size
+        if base is None:
+            self.image = Image.new(mode, size)
+        else:
+            self.image = base.convert(mode)
+
+    def paste(self, img: Image.Image, position: Tuple[int, int]):
+        self.image.paste(img, position)
+
+    def to_image(self) -> Image.Image:
+        return self.image
+
+    def close(self):
+        self.image.close()
+
+
+class ArrayCanvas:
+    def __init__(self, mode: str, size: Tuple[int, int], base: Optional[Image.Image] = None):
+        self.mode = mode
+        self.size = size
+        self.array_mode = CANVAS_MODES.get(mode, mode)
+        if base is None:
+            self.array = numpy.zeros(array_shape(self.array_mode, size), dtype=numpy.uint8)
+        else:
+            self.array = numpy.array(base.convert(self.array_mode), dtype=numpy.uint8)
+
+    def paste(self, img: Image.Image, position: Tuple[int, int]):
+        if img.mode != self.array_mode:
+            img = img.convert(self.array_mode)
+        x, y = position
+        self.array[y:y + img.height, x:x + img.width] = to_array(img)
+
+    def to_image(self) -> Image.Image:
+        # the image shares the array's memory rather than copying it
+        return Image.frombuffer(self.array_mode, self.size, self.array, "raw", self.array_mode, 0, 1)
+
+    def close(self):
+        self.array = None
+
+
+Canvas = Union[PillowCanvas, ArrayCanvas]
+
+
+def new_canvas(mode: str, size: Tuple[int, int], base: Optional[Image.Image] = None) -> Canvas:
+    """ Create a blank canvas, or one that starts from a copy of `base`, to paste frames into. """
+    if HAS_NUMPY:
+        return ArrayCanvas(mode, size, base)
+    return PillowCanvas(mode, size, base)
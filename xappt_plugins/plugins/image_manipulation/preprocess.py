@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import hashlib
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Generator, List, Sequence, Tuple
+
+from xappt_plugins.utilities import imap_unordered_bounded, lazy_import
+
+Image = lazy_import("PIL.Image")
+
+Box = Tuple[int, int, int, int]
+
+# `box` is the part of the frame that will be kept, `digest` identifies the pixels inside of `box`
+FrameInfo = namedtuple("FrameInfo", ["size", "box", "digest"])
+
+# `cell_frames` holds the index of the frame that fills each atlas cell, `frame_cells` holds the
+# cell used by each frame, and `boxes` holds the part of each frame that is placed in its cell
+CellPlan = namedtuple("CellPlan", ["cell_frames", "frame_cells", "boxes"])
+
+# fully transparent frames still need a cell, this is the box they are trimmed to
+EMPTY_BOX = (0, 0, 1, 1)
+
+
+def box_size(box: Box) -> Tuple[int, int]:
+    return box[2] - box[0], box[3] - box[1]
+
+
+def union_box(boxes: Sequence[Box]) -> Box:
+    return (min(b[0] for b in boxes), min(b[1] for b in boxes),
+            max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+
+def analyze_frame(item: Tuple[int, str, str, bool]) -> Tuple[int, FrameInfo]:
+    index, path, image_mode, trim = item
+    with Image.open(path) as img:
+        frame = img.convert(image_mode) if img.mode != image_mode else img
+        box = (0, 0, frame.width, frame.height)
+        if trim and "A" in frame.getbands():
+            box = frame.getchannel("A").getbbox() or EMPTY_BOX
+        cropped = frame.crop(box)
+        digest = hashlib.sha1(f"{cropped.width}x{cropped.height}".encode("utf8"))
+        digest.update(cropped.tobytes())
+        return index, FrameInfo(frame.size, box, digest.hexdigest())
+
+
+def analyze_frames(sources: Sequence[str], image_mode: str, **kwargs) -> Generator[Tuple[int, FrameInfo], None, None]:
+    """ Decode each frame on a thread pool to find the bounding box of its visible pixels and a hash of them.
+    `(index, FrameInfo)` pairs are yielded in the order they finish, frames are not kept in memory.
+    """
+    trim = kwargs.get('trim', False)
+    jobs = kwargs.get('jobs', 1)
+    prefetch = kwargs.get('prefetch', jobs * 2)
+    items = ((index, path, image_mode, trim) for index, path in enumerate(sources))
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        yield from imap_unordered_bounded(executor, analyze_frame, items, max_in_flight=prefetch)
+
+
+def identity_plan(sizes: Sequence[Tuple[int, int]]) -> CellPlan:
+    frame_indices = list(range(len(sizes)))
+    return CellPlan(frame_indices, frame_indices, [(0, 0, w, h) for w, h in sizes])
+
+
+def plan_cells(infos: Sequence[FrameInfo], *, dedupe: bool, uniform: bool) -> CellPlan:
+    """ Decide which frames need an atlas cell. With `dedupe` frames with identical pixels share a cell.
+    When the layout needs `uniform` cells every frame is cropped to the union of all trimmed boxes,
+    so frames only share a cell if their pixels are also in the same position.
+    """
+    boxes: List[Box] = [info.box for info in infos]
+    if uniform:
+        shared_box = union_box(boxes)
+        boxes = [shared_box] * len(boxes)
+
+    cell_frames = []
+    frame_cells = []
+    known_cells = {}
+    for index, info in enumerate(infos):
+        key = (info.digest, info.box) if uniform else info.digest
+        if dedupe and key in known_cells:
+            frame_cells.append(known_cells[key])
+            continue
+        known_cells[key] = len(cell_frames)
+        frame_cells.append(len(cell_frames))
+        cell_frames.append(index)
+    return CellPlan(cell_frames, frame_cells, boxes)
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import os
+import struct
+
+from typing import Optional, Tuple
+
+from xappt_plugins.plugins.image_manipulation import pixels
+from xappt_plugins.utilities import lazy_import
+
+Image = lazy_import("PIL.Image")
+
+RAW_MAGIC = b"XRAW"
+RAW_VERSION = 1
+# magic, version, width, height, followed by padding up to `RAW_HEADER_SIZE`
+RAW_HEADER = struct.Struct("<4sHII")
+RAW_HEADER_SIZE = 64
+RAW_EXTENSION = ".canvas.raw"
+
+# every pixel is stored with four channels, so the mapped pages can be handed to Pillow without copying them
+RAW_MODES = {
+    "RGBA": "RGBA",
+    "RGB": "RGBX",
+}
+
+# how many rows are converted at a time when copying an image onto a raw canvas
+STRIP_ROWS = 256
+
+
+def spill_path(output_file: str) -> str:
+    """ The raw file is kept next to the output, which is usually on a real disk rather than
+    in a temp directory that may be backed by memory.
+    """
+    return f"{os.path.splitext(output_file)[0]}{RAW_EXTENSION}"
+
+
+def create_raw(path: str, size: Tuple[int, int]) -> "pixels.numpy.memmap":
+    width, height = size
+    with open(path, "wb") as fp:
+        fp.write(RAW_HEADER.pack(RAW_MAGIC, RAW_VERSION, width, height).ljust(RAW_HEADER_SIZE, b"\0"))
+        # the file is sparse until pixels are written to it
+        fp.truncate(RAW_HEADER_SIZE + width * height * 4)
+    return pixels.numpy.memmap(path, dtype=pixels.numpy.uint8, mode="r+", offset=RAW_HEADER_SIZE,
+                               shape=(height, width, 4))
+
+
+class RawCanvas:
+    """ A canvas that lives in a memory-mapped file at `path` instead of in process memory.
+    The file is removed when the canvas is closed.
+    """
+    def __init__(self, mode: str, size: Tuple[int, int], path: str, base: Optional[Image.Image] = None):
+        if not pixels.HAS_NUMPY:
+            raise RuntimeError("numpy is required to spill images to disk")
+        self.mode = mode
+        self.size = size
+        self.path = path
+        self.raw_mode = RAW_MODES[mode]
+        self.array = create_raw(path, size)
+        if base is not None:
+            self.paste_strips(base)
+
+    def paste(self, img: Image.Image, position: Tuple[int, int]):
+        if img.mode != self.raw_mode:
+            img = img.convert(self.raw_mode)
+        x, y = position
+        self.array[y:y + img.height, x:x + img.width] = pixels.to_array(img)
+
+    def paste_strips(self, img: Image.Image):
+        """ Copy `img` onto the canvas a few rows at a time, so that only one strip is ever
+        converted in memory rather than the whole image.
+        """
+        for top in range(0, img.height, STRIP_ROWS):
+            bottom = min(img.height, top + STRIP_ROWS)
+            self.paste(img.crop((0, top, img.width, bottom)), (0, top))
+
+    def view(self) -> "pixels.numpy.ndarray":
+        """ A view of the mapped pixels with only the channels used by `mode`. """
+        return self.array[:, :, :pixels.mode_channels(self.mode)]
+
+    def to_image(self) -> Image.Image:
+        # the image reads straight from the mapped pages, so encoding it streams the file from disk
+        return Image.frombuffer(self.raw_mode, self.size, self.array, "raw", self.raw_mode, 0, 1)
+
+    def close(self):
+        if self.array is None:
+            return
+        self.array = None
+        os.remove(self.path)
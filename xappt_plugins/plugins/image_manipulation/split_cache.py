@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+
+from typing import Dict, Optional
+
+from xappt_plugins.plugins.image_manipulation.stitch_cache import file_signature
+from xappt_plugins.utilities import lazy_import
+
+Image = lazy_import("PIL.Image")
+
+INDEX_VERSION = 1
+
+
+def index_path(output_path: str, output_name: str) -> str:
+    return os.path.join(output_path, f"{output_name}.split.manifest")
+
+
+def tile_digest(tile: Image.Image) -> str:
+    return hashlib.sha1(tile.tobytes()).hexdigest()
+
+
+def read_index(path: str, parameters: Dict) -> Dict[str, Dict]:
+    """ Load the tile records from the index at `path`, keyed on tile file name. An empty
+    dictionary is returned if there is no index or if it was written with different `parameters`.
+    """
+    if not os.path.isfile(path):
+        return {}
+    try:
+        with open(path, "r") as fp:
+            index = json.load(fp)
+    except (OSError, ValueError):
+        return {}
+    if index.get("version") != INDEX_VERSION or index.get("parameters") != parameters:
+        return {}
+    return index['tiles']
+
+
+def write_index(path: str, parameters: Dict, tiles: Dict[str, Dict]):
+    index = {
+        "version": INDEX_VERSION,
+        "parameters": parameters,
+        "tiles": tiles,
+    }
+    with open(path, "w", newline="\n") as fp:
+        json.dump(index, fp, indent=2, sort_keys=True)
+
+
+def tile_record(dst: str, digest: str) -> Dict:
+    record = {"sha1": digest}
+    record.update(file_signature(dst))
+    return record
+
+
+def is_unchanged(record: Optional[Dict], dst: str, digest: str) -> bool:
+    """ A tile only needs to be written again if its pixels changed, or if the file on disk
+    is no longer the one that was written when `record` was made.
+    """
+    if record is None or record['sha1'] != digest or not os.path.isfile(dst):
+        return False
+    signature = file_signature(dst)
+    return record['size'] == signature['size'] and record['mtime_ns'] == signature['mtime_ns']
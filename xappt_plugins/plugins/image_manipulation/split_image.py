@@ -1,17 +1,40 @@
+from __future__ import annotations
+
 import os
 
-from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
 
 import xappt
 
+from xappt_plugins.plugins.image_manipulation import pixels, split_cache
+from xappt_plugins.plugins.image_manipulation.raw_canvas import RawCanvas, spill_path
+from xappt_plugins.utilities import ThrottledProgress, imap_unordered_bounded, lazy_import
 from xappt_plugins.validators import *
 
+Image = lazy_import("PIL.Image")
+
 SUPPORTED_EXTENSIONS = {
     ".png": {"mode": "RGBA"},
     ".jpg": {"mode": "RGB"},
     ".jpeg": {"mode": "RGB"},
 }
 
+# how many extracted tiles may be waiting on the encoder pool, per worker
+TILES_IN_FLIGHT_PER_JOB = 2
+
+
+def save_tile(item: Tuple[int, Image.Image, str, Optional[Dict]]) -> Tuple[int, bool, Dict]:
+    """ Save a tile unless its `record` from a previous split shows that the file on disk already
+    holds the same pixels. Returns the tile index, whether it was written, and its new record.
+    """
+    tile_index, tile, dst, record = item
+    digest = split_cache.tile_digest(tile)
+    if split_cache.is_unchanged(record, dst, digest):
+        return tile_index, False, record
+    tile.save(dst)
+    return tile_index, True, split_cache.tile_record(dst, digest)
+
 
 @xappt.register_plugin
 class SplitImage(xappt.BaseTool):
@@ -25,6 +48,13 @@ class SplitImage(xappt.BaseTool):
                                description="How many pixels wide is each tile? All tiles are assumed to be square.")
     replace = xappt.ParamBool(options={'short_name': "r"}, default=False,
                               description="Should we replace existing files?")
+    jobs = xappt.ParamInt(options={'short_name': "j"}, minimum=1, default=os.cpu_count() or 1,
+                          description="How many tiles should be encoded in parallel?")
+    incremental = xappt.ParamBool(options={'short_name': "n"}, default=True,
+                                  description="Should tiles that have not changed be left untouched?")
+    spill = xappt.ParamBool(options={'short_name': "m"}, default=False,
+                            description="Should the image be kept in a memory-mapped file instead of in memory "
+                                        "while it is split? Requires numpy.")
 
     @classmethod
     def name(cls) -> str:
@@ -47,6 +77,10 @@ class SplitImage(xappt.BaseTool):
             self.interface.error(f"File extension '{output_ext}' is not supported")
             return 1
 
+        if self.spill.value and not pixels.HAS_NUMPY:
+            self.interface.error("numpy is required to spill images to disk")
+            return 1
+
         tile_size = self.tile_size.value
 
         img = Image.open(input_path)
@@ -61,20 +95,68 @@ class SplitImage(xappt.BaseTool):
         rows = sh // tile_size
 
         mode = SUPPORTED_EXTENSIONS[output_ext.lower()]['mode']
-
         total = rows * cols
-        self.interface.progress_start()
-
-        for y in range(rows):
-            for x in range(cols):
-                tile_index = ((y * cols) + x) + 1
-                self.interface.progress_update(f"Extracting tile {tile_index}", tile_index / total)
+        jobs = self.jobs.value
+
+        index_file = split_cache.index_path(self.output_path.value, output_name)
+        index_parameters = {"tile_size": tile_size, "mode": mode}
+        if self.incremental.value:
+            known_tiles = split_cache.read_index(index_file, index_parameters)
+        else:
+            known_tiles = {}
+
+        if not self.replace.value:
+            # tiles recorded in the index were written by a previous split, anything else is left alone
+            for tile_index in range(1, total + 1):
                 dst = output_path % tile_index
-                result = Image.new(mode, (tile_size, tile_size))
-                result.paste(img, (-x * tile_size, -y * tile_size))
-                result.save(dst)
-
-        self.interface.progress_end()
-        self.interface.message("Complete")
+                if os.path.basename(dst) not in known_tiles and os.path.isfile(dst):
+                    self.interface.error(f"File exists: '{dst}'")
+                    return 1
+
+        canvas = None
+        if self.spill.value:
+            # the decoded image is copied into the mapped file a strip at a time and then released,
+            # tiles are read from views of the mapped pages
+            canvas = RawCanvas(mode, img.size, spill_path(os.path.join(self.output_path.value, output_name)))
+            canvas.paste_strips(img)
+            img.close()
+            source = canvas.view()
+        elif img.mode != mode:
+            # convert once so that every tile is cropped from pixels that are already in the output mode
+            source = img.convert(mode)
+        else:
+            img.load()
+            source = img
+
+        tiles = ((tile_index, tile, output_path % tile_index,
+                  known_tiles.get(os.path.basename(output_path % tile_index)))
+                 for tile_index, tile in pixels.split_tiles(source, tile_size))
+
+        progress = ThrottledProgress(self.interface)
+        progress.start()
+
+        tile_records = {}
+        written = 0
+        try:
+            # Pillow releases the GIL while encoding, so threads are enough to keep every core busy
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                saved_tiles = imap_unordered_bounded(executor, save_tile, tiles,
+                                                     max_in_flight=jobs * TILES_IN_FLIGHT_PER_JOB)
+                for i, (tile_index, was_written, record) in enumerate(saved_tiles, start=1):
+                    tile_records[os.path.basename(output_path % tile_index)] = record
+                    if was_written:
+                        written += 1
+                        progress.update("Saved tile {}", i / total, tile_index)
+                    else:
+                        progress.update("Unchanged tile {}", i / total, tile_index)
+        finally:
+            if canvas is not None:
+                canvas.close()
+
+        if self.incremental.value:
+            split_cache.write_index(index_file, index_parameters, tile_records)
+
+        progress.end()
+        self.interface.message(f"Complete: {written} written, {total - written} unchanged")
 
         return 0
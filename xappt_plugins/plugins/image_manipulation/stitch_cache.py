@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+
+from typing import Dict, List, Optional, Sequence
+
+from xappt_plugins.plugins.image_manipulation.layout import AtlasLayout
+
+MANIFEST_VERSION = 2
+HASH_BLOCK_SIZE = 1024 * 1024
+MANIFEST_EXTENSION = ".manifest"
+
+
+def manifest_path(output_file: str) -> str:
+    return f"{os.path.splitext(output_file)[0]}{MANIFEST_EXTENSION}"
+
+
+def is_manifest(file_name: str) -> bool:
+    return file_name.endswith(MANIFEST_EXTENSION)
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha1()
+    with open(path, "rb") as fp:
+        for block in iter(lambda: fp.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_signature(path: str) -> Dict:
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def frame_records(sources: Sequence[str], previous: Optional[Dict] = None) -> List[Dict]:
+    """ Describe each frame in `sources` by name, size, modification time and content hash.
+    Hashes from a `previous` manifest are reused for frames whose size and modification time
+    have not changed, so only touched files are read.
+    """
+    known = {}
+    if previous is not None:
+        known = {frame['name']: frame for frame in previous['frames']}
+    records = []
+    for source in sources:
+        name = os.path.basename(source)
+        record = {"name": name}
+        record.update(file_signature(source))
+        old_record = known.get(name)
+        if old_record is not None and old_record['size'] == record['size'] \
+                and old_record['mtime_ns'] == record['mtime_ns']:
+            record['sha1'] = old_record['sha1']
+        else:
+            record['sha1'] = file_digest(source)
+        records.append(record)
+    return records
+
+
+def read_manifest(output_file: str) -> Optional[Dict]:
+    """ Load the manifest that was written alongside `output_file`. `None` is returned if there
+    isn't one, or if `output_file` was changed or removed since the manifest was written.
+    """
+    path = manifest_path(output_file)
+    if not os.path.isfile(path) or not os.path.isfile(output_file):
+        return None
+    try:
+        with open(path, "r") as fp:
+            manifest = json.load(fp)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    if manifest.get("output") != file_signature(output_file):
+        return None
+    return manifest
+
+
+def layout_to_dict(layout: AtlasLayout) -> Dict:
+    return {"size": list(layout.size), "placements": [list(p) for p in layout.placements]}
+
+
+def layout_matches(manifest: Dict, layout: AtlasLayout) -> bool:
+    return manifest['layout'] == layout_to_dict(layout)
+
+
+def write_manifest(output_file: str, parameters: Dict, frames: List[Dict], layout: AtlasLayout):
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "parameters": parameters,
+        "layout": layout_to_dict(layout),
+        "output": file_signature(output_file),
+        "frames": frames,
+    }
+    with open(manifest_path(output_file), "w", newline="\n") as fp:
+        json.dump(manifest, fp, indent=2)
+
+
+def changed_frames(manifest: Optional[Dict], parameters: Dict, frames: List[Dict]) -> Optional[List[int]]:
+    """ Return the indices of `frames` that differ from `manifest`. `None` is returned when the
+    existing output can't be updated in place and has to be rebuilt from scratch.
+    """
+    if manifest is None:
+        return None
+    if manifest['parameters'] != parameters or len(manifest['frames']) != len(frames):
+        return None
+    changed = []
+    for i, (old, new) in enumerate(zip(manifest['frames'], frames)):
+        if old['name'] != new['name'] or old['sha1'] != new['sha1']:
+            changed.append(i)
+    return changed
@@ -1,27 +1,47 @@
+from __future__ import annotations
+
 import logging
-import math
 import os
+import time
 
-from typing import Generator
-
-import pyseq
-from boltons.iterutils import chunked_iter, pairwise_iter
-from PIL import Image
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Generator, Iterable, List, Optional, Tuple
 
 import xappt
 
+from xappt_plugins.plugins.image_manipulation import pixels, stitch_cache
+from xappt_plugins.plugins.image_manipulation.raw_canvas import RawCanvas, spill_path
+from xappt_plugins.plugins.image_manipulation.atlas_data import ATLAS_FORMATS, AtlasFrame, write_atlas_data
+from xappt_plugins.plugins.image_manipulation.layout import LAYOUTS, UNIFORM_LAYOUTS, AtlasLayout, get_layout
+from xappt_plugins.plugins.image_manipulation.preprocess import Box, analyze_frames, box_size, identity_plan, \
+    plan_cells
+from xappt_plugins.utilities import HeadlessInterface, ThrottledProgress, imap_unordered_bounded, lazy_import
 from xappt_plugins.validators import ValidateFolderExists
 
+Image = lazy_import("PIL.Image")
+pyseq = lazy_import("pyseq")
+# only needed when sequences are stitched in parallel, and slow to import
+process = lazy_import("concurrent.futures.process")
+
 logger = logging.getLogger("xappt")
 logger.setLevel(logging.DEBUG)
 
+# only lossless formats have individual cells updated in place, lossy formats are always re-encoded from the frames
 SUPPORTED_EXTENSIONS = {
-    ".png": {"mode": "RGBA"},
-    ".jpg": {"mode": "RGB"},
-    ".jpeg": {"mode": "RGB"},
+    ".png": {"mode": "RGBA", "lossless": True},
+    ".jpg": {"mode": "RGB", "lossless": False},
+    ".jpeg": {"mode": "RGB", "lossless": False},
 }
 
-PO2 = [2 ** (x + 1) for x in range(16)]
+# how many frames may be decoded ahead of the joiner, per worker
+FRAMES_IN_FLIGHT_PER_JOB = 2
+
+STATUS_WRITTEN = "written"
+STATUS_SKIPPED = "skipped"
+STATUS_FAILED = "failed"
+
+StitchResult = namedtuple("StitchResult", ["sequence", "status", "output", "elapsed", "message"])
 
 
 def coroutine(func):
@@ -32,90 +52,233 @@ def coroutine(func):
     return start
 
 
-def get_matching_po2(n: int) -> int:
-    for lower, upper in pairwise_iter(PO2):
-        if n == lower:
-            return n
-        if n == upper:
-            return n
-        if lower < n < upper:
-            return upper
-    raise ValueError(f"Could not find power of 2 for '{n}'")
+def load_frame(item: Tuple[int, str, str, Optional[Box]]) -> Tuple[int, Image.Image]:
+    index, path, image_mode, box = item
+    with Image.open(path) as img:
+        if img.mode != image_mode:
+            frame = img.convert(image_mode)
+        else:
+            img.load()
+            frame = img.copy()
+    if box is not None and box != (0, 0, frame.width, frame.height):
+        frame = frame.crop(box)
+    return index, frame
+
+
+def decode_frames(sources: Iterable[Tuple[int, str, Optional[Box]]], image_mode: str, **kwargs) \
+        -> Generator[Tuple[int, Image.Image], None, None]:
+    """ Decode the `(index, path, box)` items in `sources` on a thread pool, cropping each frame to `box`
+    if one is given, and yield `(index, frame)` pairs in the order they finish. At most `prefetch`
+    frames are decoded ahead of the consumer.
+    """
+    jobs = kwargs.get('jobs', 1)
+    prefetch = kwargs.get('prefetch', jobs * FRAMES_IN_FLIGHT_PER_JOB)
+    items = ((index, path, image_mode, box) for index, path, box in sources)
+    # Pillow releases the GIL while decoding, so threads are enough to keep every core busy
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        yield from imap_unordered_bounded(executor, load_frame, items, max_in_flight=prefetch)
 
 
 @coroutine
-def join_slices(output: str, **kwargs) -> Generator[None, str, None]:
+def join_slices(output: str, **kwargs) -> Generator[None, Optional[Tuple[int, Image.Image]], None]:
+    """ Paste the `(index, frame)` pairs sent to it onto a canvas. The output is only saved once the joiner is
+    finished with `finish_join`, closing it before then discards the canvas and leaves the output untouched.
+    """
     image_mode = kwargs['image_mode']
-    columns = kwargs['columns']
-    force_po2 = kwargs.get('force_po2', True)
-    tile_w = 0
-    tile_h = 0
-    slices = []
+    layout: AtlasLayout = kwargs['layout']
+    # an existing `canvas` image can be passed in to only update some of the frames
+    base = kwargs.get('canvas')
+    if kwargs.get('spill', False):
+        result = RawCanvas(image_mode, layout.size, spill_path(output), base=base)
+    else:
+        result = pixels.new_canvas(image_mode, layout.size, base=base)
     try:
         while True:
-            image_slice = yield
-            img = Image.open(image_slice)
-            slices.append(img)
-            # make sure all tiles are the same size
-            sw, sh = img.size
-            if tile_w == 0:
-                tile_w = sw
-            else:
-                assert sw == tile_w
-            if tile_h == 0:
-                tile_h = sh
-            else:
-                assert sh == tile_h
-    except GeneratorExit:
-        rows = int(math.ceil(len(slices) / float(columns)))
-        if force_po2:
-            img_size = (get_matching_po2(tile_w * columns), get_matching_po2(tile_w * rows))
-        else:
-            img_size = (tile_w * columns, tile_w * rows)
-        result = Image.new(image_mode, img_size)
-        for row, images in enumerate(chunked_iter(slices, columns)):
-            x = 0
-            for img in images:
-                sw, sh = img.size
-                result.paste(img, (x, row * sh))
-                x += sw
-        result.save(output)
-
-
-def stitch_sequence(interface: xappt.BaseInterface, sequence: pyseq.Sequence, **kwargs):
+            item = yield
+            if item is None:
+                break
+            index, img = item
+            # frames may arrive in any order, their position is looked up by index
+            placement = layout.placements[index]
+            assert img.size == (placement.width, placement.height)
+            result.paste(img, (placement.x, placement.y))
+            img.close()
+        result.to_image().save(output)
+    finally:
+        result.close()
+
+
+def finish_join(joiner: Generator):
+    """ Tell a `join_slices` joiner that every frame has been sent, so it saves the output. """
+    try:
+        joiner.send(None)
+    except StopIteration:
+        pass
+
+
+def read_frame_sizes(sources: Iterable[str]) -> List[Tuple[int, int]]:
+    sizes = []
+    for source in sources:
+        # only the header is read here, the pixels are decoded later
+        with Image.open(source) as img:
+            sizes.append(img.size)
+    return sizes
+
+
+def stitch_sequence(interface: xappt.BaseInterface, sequence: pyseq.Sequence, **kwargs) -> StitchResult:
     input_path = kwargs['input_path']
     output_path = kwargs['output_path']
     columns = kwargs['columns']
     force_po2 = kwargs['force_po2']
+    layout_name = kwargs.get('layout', "grid")
+    atlas_format = kwargs.get('atlas_data', "none")
+    trim = kwargs.get('trim', False)
+    dedupe = kwargs.get('dedupe', False)
+    jobs = kwargs.get('jobs', 1)
+    prefetch = kwargs.get('prefetch', jobs * FRAMES_IN_FLIGHT_PER_JOB)
+    spill = kwargs.get('spill', False)
+
+    start = time.perf_counter()
+    sequence_name = sequence.format("%h%r%t")
 
     if len(sequence) == 1:
-        logger.warning(f"Skipping '{sequence[0]}'. Not a sequence.")
-        return
+        message = f"Skipping '{sequence[0]}'. Not a sequence."
+        logger.warning(message)
+        return StitchResult(sequence_name, STATUS_SKIPPED, None, time.perf_counter() - start, message)
 
     extension = os.path.splitext(sequence.format("%h%p%t"))[-1].lower()
     if extension not in SUPPORTED_EXTENSIONS.keys():
-        logger.warning(f"'{extension}' not supported")
-        return
+        message = f"'{extension}' not supported"
+        logger.warning(message)
+        return StitchResult(sequence_name, STATUS_SKIPPED, None, time.perf_counter() - start, message)
 
     image_mode = SUPPORTED_EXTENSIONS[extension]['mode']
 
     output_file = os.path.join(output_path, f"{sequence.head()}[stitched]{sequence.tail()}")
+
+    frames = list(sequence)
+    sources = [os.path.join(input_path, frame) for frame in frames]
+
+    incremental = kwargs.get('incremental', False)
+    parameters = {"columns": columns, "force_po2": force_po2, "image_mode": image_mode,
+                  "layout": layout_name, "atlas_data": atlas_format, "trim": trim, "dedupe": dedupe}
+    manifest = stitch_cache.read_manifest(output_file) if incremental else None
+    frame_records = stitch_cache.frame_records(sources, manifest) if incremental else []
+    changed = stitch_cache.changed_frames(manifest, parameters, frame_records)
+
+    if changed is not None and len(changed) == 0:
+        message = "Up to date"
+        logger.info(f"Skipping '{sequence_name}'. {message}.")
+        return StitchResult(sequence_name, STATUS_SKIPPED, output_file, time.perf_counter() - start, message)
+
     if os.path.isfile(output_file) and not kwargs['replace']:
         raise OSError(f"File exists: '{output_file}'")
 
-    progress_max = len(sequence)
+    progress = ThrottledProgress(interface)
+    progress.start()
+
+    if trim or dedupe:
+        frame_infos = [None] * len(frames)
+        analyzed = analyze_frames(sources, image_mode, trim=trim, jobs=jobs, prefetch=prefetch)
+        for i, (index, info) in enumerate(analyzed, start=1):
+            frame_infos[index] = info
+            progress.update("analyzed {}", i / len(frames), frames[index])
+        source_sizes = [info.size for info in frame_infos]
+        plan = plan_cells(frame_infos, dedupe=dedupe, uniform=layout_name in UNIFORM_LAYOUTS)
+    else:
+        source_sizes = read_frame_sizes(sources)
+        plan = identity_plan(source_sizes)
+
+    cell_sizes = [box_size(plan.boxes[frame]) for frame in plan.cell_frames]
+    layout = get_layout(layout_name)(cell_sizes, columns=columns, force_po2=force_po2)
+
+    if changed is not None and SUPPORTED_EXTENSIONS[extension]['lossless'] and not (trim or dedupe) \
+            and stitch_cache.layout_matches(manifest, layout):
+        # only the changed cells need to be pasted into the existing output, which the joiner
+        # copies onto its canvas as soon as it starts
+        with Image.open(output_file) as existing:
+            joiner = join_slices(output_file, layout=layout, image_mode=image_mode, spill=spill, canvas=existing)
+        cells = changed
+    else:
+        joiner = join_slices(output_file, layout=layout, image_mode=image_mode, spill=spill)
+        cells = range(len(plan.cell_frames))
+
+    progress_max = len(cells)
+
+    cell_sources = ((cell, sources[plan.cell_frames[cell]], plan.boxes[plan.cell_frames[cell]]) for cell in cells)
+    decoded = decode_frames(cell_sources, image_mode, jobs=jobs, prefetch=prefetch)
+    try:
+        for i, (cell, img) in enumerate(decoded, start=1):
+            joiner.send((cell, img))
+            progress.update("processed {}", i / progress_max, frames[plan.cell_frames[cell]])
+        finish_join(joiner)
+    finally:
+        # a joiner that wasn't finished, because a frame failed to decode, is discarded without saving
+        joiner.close()
+
+    progress.end()
+
+    if atlas_format != "none":
+        atlas_frames = []
+        for index, frame in enumerate(frames):
+            placement = layout.placements[plan.frame_cells[index]]
+            offset = plan.boxes[index][:2]
+            atlas_frames.append(AtlasFrame(str(frame), placement, source_sizes[index], offset))
+        write_atlas_data(atlas_format, output_file, layout.size, image_mode, atlas_frames)
 
-    interface.progress_start()
+    if incremental:
+        stitch_cache.write_manifest(output_file, parameters, frame_records, layout)
 
-    joiner = join_slices(output_file, columns=columns, force_po2=force_po2, image_mode=image_mode)
-    for i, frame in enumerate(sequence, start=1):
-        progress = i / progress_max
-        source = os.path.join(input_path, frame)
-        joiner.send(source)
-        interface.progress_update(f"processed {frame}", progress)
-    joiner.close()
+    return StitchResult(sequence_name, STATUS_WRITTEN, output_file, time.perf_counter() - start, "")
+
+
+def try_stitch_sequence(interface: xappt.BaseInterface, sequence: pyseq.Sequence, **kwargs) -> StitchResult:
+    start = time.perf_counter()
+    try:
+        return stitch_sequence(interface, sequence, **kwargs)
+    except Exception as e:
+        interface.progress_end()
+        logger.error(f"Failed to stitch '{sequence.format('%h%r%t')}': {e}")
+        return StitchResult(sequence.format("%h%r%t"), STATUS_FAILED, None, time.perf_counter() - start, str(e))
 
-    interface.progress_end()
+
+def stitch_sequence_process(item: Tuple[List[str], Dict]) -> StitchResult:
+    # `pyseq.Sequence` can't be pickled, so worker processes receive the frame names and rebuild it
+    frame_names, kwargs = item
+    return try_stitch_sequence(HeadlessInterface(), pyseq.Sequence(frame_names), **kwargs)
+
+
+def stitch_sequences(interface: xappt.BaseInterface, sequences: List[pyseq.Sequence], **kwargs) \
+        -> Generator[StitchResult, None, None]:
+    """ Stitch each of `sequences`, yielding a `StitchResult` for each one as it finishes.
+    When `parallel_sequences` is greater than one the sequences are distributed across worker
+    processes and the `jobs` decode threads are shared out between them.
+    """
+    parallel_sequences = min(kwargs.get('parallel_sequences', 1), len(sequences))
+    if parallel_sequences <= 1:
+        for sequence in sequences:
+            yield try_stitch_sequence(interface, sequence, **kwargs)
+        return
+
+    process_kwargs = kwargs.copy()
+    process_kwargs['jobs'] = max(1, kwargs.get('jobs', 1) // parallel_sequences)
+    items = (([str(frame) for frame in sequence], process_kwargs) for sequence in sequences)
+    with process.ProcessPoolExecutor(max_workers=parallel_sequences) as executor:
+        yield from imap_unordered_bounded(executor, stitch_sequence_process, items,
+                                          max_in_flight=parallel_sequences * 2)
+
+
+def summarize_results(results: List[StitchResult], elapsed: float) -> str:
+    counts = {status: 0 for status in (STATUS_WRITTEN, STATUS_SKIPPED, STATUS_FAILED)}
+    lines = []
+    for result in sorted(results, key=lambda r: r.sequence):
+        counts[result.status] += 1
+        line = f"{result.sequence}: {result.status} in {result.elapsed:.2f}s"
+        if len(result.message):
+            line += f" ({result.message})"
+        lines.append(line)
+    totals = ", ".join(f"{count} {status}" for status, count in counts.items())
+    return "\n".join([f"Complete: {totals} in {elapsed:.2f}s"] + lines)
 
 
 @xappt.register_plugin
@@ -127,11 +290,29 @@ class StitchImages(xappt.BaseTool):
                                     description="Where should the stitched image be saved?",
                                     validators=[ValidateFolderExists])
     columns = xappt.ParamInt(options={'short_name': "c"}, default=8,
-                             description="How many images per row?")
+                             description="How many images per row? Only used by the grid layout.")
+    layout = xappt.ParamString(options={'short_name': "l"}, default="grid", choices=tuple(LAYOUTS.keys()),
+                               description="How should the images be arranged?")
+    atlas_data = xappt.ParamString(options={'short_name': "d"}, default="none",
+                                   choices=("none", ) + tuple(ATLAS_FORMATS.keys()),
+                                   description="Should a description of where each image was placed be saved?")
+    trim = xappt.ParamBool(options={'short_name': "t"}, default=False,
+                           description="Should transparent borders be trimmed from each image?")
+    dedupe = xappt.ParamBool(options={'short_name': "u"}, default=False,
+                             description="Should identical images share a single space in the output?")
     replace = xappt.ParamBool(options={'short_name': "r"}, default=False,
                               description="Should we replace existing files?")
     force_po2 = xappt.ParamBool(options={'short_name': "p", "caption": "Force res²"}, default=False,
                                 description="Should the output image dimensions be a power of 2?")
+    jobs = xappt.ParamInt(options={'short_name': "j"}, minimum=1, default=os.cpu_count() or 1,
+                          description="How many frames should be decoded in parallel?")
+    parallel_sequences = xappt.ParamInt(options={'short_name': "s"}, minimum=1, default=1,
+                                        description="How many sequences should be stitched at the same time?")
+    incremental = xappt.ParamBool(options={'short_name': "n"}, default=True,
+                                  description="Should unchanged sequences and frames be skipped?")
+    spill = xappt.ParamBool(options={'short_name': "m"}, default=False,
+                            description="Should the stitched image be assembled in a memory-mapped file "
+                                        "instead of in memory? Requires numpy.")
 
     @classmethod
     def name(cls) -> str:
@@ -146,8 +327,25 @@ class StitchImages(xappt.BaseTool):
         return "Image"
 
     def execute(self, **kwargs) -> int:
-        sequences = pyseq.get_sequences(os.listdir(self.input_path.value))
-        for sequence in sequences:
-            stitch_sequence(self.interface, sequence, **self.param_dict())
-        self.interface.message("Complete")
+        if self.spill.value and not pixels.HAS_NUMPY:
+            self.interface.error("numpy is required to spill images to disk")
+            return 1
+
+        start = time.perf_counter()
+        # manifests are written next to the stitched images, and the output path may be the input path
+        file_names = [name for name in os.listdir(self.input_path.value) if not stitch_cache.is_manifest(name)]
+        sequences = pyseq.get_sequences(file_names)
+        results = []
+        if self.parallel_sequences.value > 1:
+            # progress is reported per sequence since the frames are handled in other processes
+            self.interface.progress_start()
+            for result in stitch_sequences(self.interface, sequences, **self.param_dict()):
+                results.append(result)
+                self.interface.progress_update(f"{result.status} {result.sequence}", len(results) / len(sequences))
+            self.interface.progress_end()
+        else:
+            results.extend(stitch_sequences(self.interface, sequences, **self.param_dict()))
+        self.interface.message(summarize_results(results, time.perf_counter() - start))
+        if any(result.status == STATUS_FAILED for result in results):
+            return 1
         return 0
@@ -1,18 +1,31 @@
 import datetime
 import logging
 import os
-import time
 
-import pyscreenshot
+from typing import Optional
 
 import xappt
-import xappt_qt
 
+from xappt_plugins.plugins.image_manipulation.capture import (CaptureEngine, CaptureIndex, FrameDiffer, grab_regions,
+                                                              parse_rects)
+from xappt_plugins.plugins.image_manipulation.frame_writers import (CONTAINERS, CONTAINER_NONE, FrameLocation,
+                                                                   create_writer)
+from xappt_plugins.utilities import ThrottledProgress, lazy_import
 from xappt_plugins.validators import *
 
+pyscreenshot = lazy_import("pyscreenshot")
+xappt_qt = lazy_import("xappt_qt")
+
 logger = logging.getLogger("xappt")
 logger.setLevel(logging.DEBUG)
 
+# grabs are scheduled on a monotonic clock and encoded on a background thread, so short intervals are fine
+MINIMUM_INTERVAL = 0.25
+# how many screenshots may be waiting to be saved before new ones are dropped
+ENCODE_QUEUE_DEPTH = 4
+# how often the countdown to the next screenshot is refreshed
+PROGRESS_TICK = 0.25
+
 
 @xappt.register_plugin
 class TimeLapse(xappt.BaseTool):
@@ -25,15 +38,33 @@ class TimeLapse(xappt.BaseTool):
                                     description="What date format should be used in the file names?")
     output_format = xappt.ParamString(options={'short_name': "f"}, default=".jpg", choices=('.jpg', '.png'),
                                       description="What file format should be used?")
-    interval = xappt.ParamFloat(options={'short_name': "i"}, minimum=2.0, default=5.0,
+    interval = xappt.ParamFloat(options={'short_name': "i"}, minimum=MINIMUM_INTERVAL, default=5.0,
                                 description="How much time between each screenshot?")
     bounds = xappt.ParamString(options={'short_name': "b"}, required=False, default="",
-                               description="Specify optional recording coordinates: x1,y1,x2,y2",
-                               validators=[ValidateRectString])
+                               description="Specify optional recording coordinates: x1,y1,x2,y2. Separate several "
+                                           "regions with semicolons to record them side by side.",
+                               validators=[ValidateRectListString])
+    scale = xappt.ParamFloat(options={'short_name': "z"}, minimum=0.05, maximum=1.0, default=1.0,
+                             description="How much should screenshots be scaled down before they are saved?")
+    skip_unchanged = xappt.ParamBool(options={'short_name': "s"}, default=False,
+                                     description="Should screenshots that look the same as the last saved one be "
+                                                 "skipped? A timestamp index is saved next to the screenshots.")
+    threshold = xappt.ParamInt(options={'short_name': "x"}, minimum=0, maximum=255, default=8,
+                               description="How much does part of the screen need to change for a screenshot to "
+                                           "be saved when skipping unchanged screenshots? (0-255)")
+    container = xappt.ParamString(options={'short_name': "c"}, default=CONTAINER_NONE, choices=CONTAINERS,
+                                  description="Should screenshots be saved as separate files, or appended to zip "
+                                              "archives or videos? A frame index is saved next to the archives.")
+    frames_per_file = xappt.ParamInt(options={'short_name': "k"}, minimum=1, default=1000,
+                                     description="How many screenshots should go in each archive or video before "
+                                                 "a new one is started?")
 
     def __init__(self, interface: xappt.BaseInterface, **kwargs):
         super().__init__(interface=interface, **kwargs)
         self._closed = False
+        self._engine: Optional[CaptureEngine] = None
+        self._last_name = ""
+        self._repeats = 0
 
     @classmethod
     def help(cls) -> str:
@@ -45,37 +76,84 @@ class TimeLapse(xappt.BaseTool):
 
     def on_close(self):
         self._closed = True
+        if self._engine is not None:
+            self._engine.stop()
+
+    def _frame_path(self, output_path: str, output_filename: str) -> str:
+        name = datetime.datetime.now().strftime(output_filename)
+        if name == self._last_name:
+            # intervals shorter than the resolution of `time_format` would otherwise reuse a name
+            self._repeats += 1
+            root, ext = os.path.splitext(name)
+            return os.path.join(output_path, f"{root}_{self._repeats:02d}{ext}")
+        self._last_name = name
+        self._repeats = 0
+        return os.path.join(output_path, name)
 
     def execute(self, **kwargs) -> int:
-        interval = max(2.0, self.interval.value)
-        bounds = self.bounds.value
-        if len(bounds):
-            assert bounds.count(",") == 3
-            bounds = tuple([int(x) for x in bounds.split(",")])
-            assert len(bounds) == 4
+        interval = max(MINIMUM_INTERVAL, self.interval.value)
+        regions = parse_rects(self.bounds.value) or [None]
+        scale = min(1.0, self.scale.value)
         output_path = self.output_path.value
         output_filename = f"{self.output_name.value}{self.time_format.value}{self.output_format.value}"
+        differ = None
+        index = None
+        if self.skip_unchanged.value:
+            differ = FrameDiffer(threshold=self.threshold.value)
+        if self.skip_unchanged.value or self.container.value != CONTAINER_NONE:
+            index = CaptureIndex(os.path.join(output_path, f"{self.output_name.value}index.jsonl"))
+        writer = create_writer(self.container.value, frames_per_file=self.frames_per_file.value)
+        last_saved = FrameLocation(None, None)
+
+        def save_frame(path: str, image, timestamp: float) -> bool:
+            # called on the encoder thread
+            nonlocal last_saved
+            saved = differ is None or differ.changed(image)
+            if saved:
+                last_saved = writer.write(path, image)
+            if index is not None:
+                index.record(timestamp, last_saved.file, saved, last_saved.entry)
+            return saved
+
+        self._engine = CaptureEngine(lambda: grab_regions(pyscreenshot.grab, regions, scale=scale), interval=interval,
+                                     queue_depth=ENCODE_QUEUE_DEPTH, save=save_frame)
+        if self._closed:
+            self._engine.stop()
         if isinstance(self.interface, xappt_qt.QtInterface):
             self.interface.runner.rejected.connect(self.on_close)
-        self.interface.progress_start()
+        progress = ThrottledProgress(self.interface)
+        progress.start()
+        message = ""
+
+        def on_captured(path: str):
+            nonlocal message
+            message = f"captured {os.path.basename(path)}"
+            progress.update(message, 0.0, force=True)
+
         try:
-            while not self._closed:
-                start = time.perf_counter()
-                timestamp = datetime.datetime.now()
-                out_file = os.path.join(output_path, timestamp.strftime(output_filename))
-                im = pyscreenshot.grab(bbox=bounds)
-                im.save(out_file)
-                message = f"saved {os.path.basename(out_file)}"
-                while True:
-                    if self._closed:
-                        break
-                    elapsed = time.perf_counter() - start
-                    if elapsed > interval:
-                        self.interface.progress_update("", 0.0)
-                        break
-                    self.interface.progress_update(message, elapsed/interval)
-                    time.sleep(0.1)
+            stats = self._engine.run(lambda: self._frame_path(output_path, output_filename),
+                                     on_captured=on_captured, on_wait=lambda p: progress.update(message, p),
+                                     tick=PROGRESS_TICK)
         except KeyboardInterrupt:
-            pass
-        self.interface.progress_end()
+            stats = None
+        finally:
+            try:
+                writer.close()
+            except Exception as e:
+                if self._engine.error is None:
+                    self._engine.error = e
+            if index is not None:
+                index.close()
+        progress.end()
+
+        if self._engine.error is not None:
+            self.interface.error(f"Could not save screenshot: {self._engine.error}")
+            return 1
+        if stats is not None:
+            summary = f"Saved {stats.saved} screenshots"
+            if self.skip_unchanged.value:
+                summary += f", skipped {stats.skipped} unchanged"
+            if stats.dropped or stats.missed:
+                summary += f" ({stats.dropped} dropped while saving fell behind, {stats.missed} intervals missed)"
+            self.interface.message(summary)
         return 0
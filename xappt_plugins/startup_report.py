@@ -0,0 +1,102 @@
+""" Report how long it takes to import and register the plugins, and which heavy dependencies that loads.
+
+    python -m xappt_plugins.startup_report --repeat 5 --json
+
+Every measurement is taken in a fresh interpreter, using `python -X importtime`.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+from collections import namedtuple
+from typing import Dict, List, Optional, Sequence
+
+# these should only be imported once a plugin is executed
+HEAVY_MODULES = (
+    "PIL.Image",
+    "numpy",
+    "pyseq",
+    "boltons.iterutils",
+    "pyscreenshot",
+    "Crypto.Cipher.AES",
+    "xappt_qt",
+    "concurrent.futures.process",
+)
+
+PROBE = f"""
+import json, sys, time
+start = time.perf_counter()
+import xappt_plugins.plugins
+elapsed = time.perf_counter() - start
+print(json.dumps({{"elapsed": elapsed, "loaded": [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))
+"""
+
+ImportTime = namedtuple("ImportTime", ["module", "self_us", "cumulative_us"])
+
+
+def parse_import_times(output: str) -> List[ImportTime]:
+    times = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # the header line
+        times.append(ImportTime(parts[2].strip(), int(parts[0]), int(parts[1])))
+    return times
+
+
+def measure_startup() -> Dict:
+    process = subprocess.run((sys.executable, "-X", "importtime", "-c", PROBE),
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+    result['import_times'] = parse_import_times(process.stderr)
+    return result
+
+
+def build_report(runs: Sequence[Dict], top: int) -> Dict:
+    elapsed = [run['elapsed'] for run in runs]
+    # module times are taken from the fastest run, which has the least noise
+    fastest = min(runs, key=lambda run: run['elapsed'])
+    slowest_modules = sorted(fastest['import_times'], key=lambda t: t.self_us, reverse=True)[:top]
+    return {
+        "python": sys.version.split()[0],
+        "runs": len(runs),
+        "elapsed": {"median": statistics.median(elapsed), "min": min(elapsed), "max": max(elapsed)},
+        "heavy_modules_loaded": fastest['loaded'],
+        "slowest_modules": [t._asdict() for t in slowest_modules],
+    }
+
+
+def format_report(report: Dict) -> str:
+    elapsed = report['elapsed']
+    lines = [
+        f"Plugin import: {elapsed['median'] * 1000:.1f}ms median, {elapsed['min'] * 1000:.1f}ms min "
+        f"over {report['runs']} runs",
+        f"Heavy modules loaded at startup: {', '.join(report['heavy_modules_loaded']) or 'none'}",
+        "Slowest modules (self time):",
+    ]
+    for module in report['slowest_modules']:
+        lines.append(f"  {module['self_us'] / 1000:8.2f}ms  {module['module']}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure how long it takes to import the plugins.")
+    parser.add_argument("--repeat", "-r", type=int, default=5, help="How many fresh interpreters to measure.")
+    parser.add_argument("--top", "-t", type=int, default=15, help="How many of the slowest modules to list.")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    options = parser.parse_args(argv)
+
+    report = build_report([measure_startup() for _ in range(max(1, options.repeat))], options.top)
+    if options.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(format_report(report))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1 +1,5 @@
 from .open_file import open_file
+from .bounded_pool import imap_unordered_bounded
+from .headless_interface import HeadlessInterface
+from .progress import ThrottledProgress
+from .lazy_import import lazy_import, module_available
@@ -0,0 +1,26 @@
+from concurrent.futures import Executor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Generator, Iterable
+
+
+def imap_unordered_bounded(executor: Executor, fn: Callable, iterable: Iterable, *,
+                           max_in_flight: int) -> Generator[Any, None, None]:
+    """ Submit `fn(item)` to `executor` for every item in `iterable` and yield results as they complete.
+    At most `max_in_flight` items are submitted at any time, so `iterable` is only consumed as fast as the
+    workers can keep up with it.
+    """
+    max_in_flight = max(1, max_in_flight)
+    pending = set()
+    try:
+        for item in iterable:
+            if len(pending) >= max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            pending.add(executor.submit(fn, item))
+        while len(pending):
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    finally:
+        for future in pending:
+            future.cancel()
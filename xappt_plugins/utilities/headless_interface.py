@@ -0,0 +1,45 @@
+import logging
+
+from typing import Optional
+
+import xappt
+
+logger = logging.getLogger("xappt")
+
+
+class HeadlessInterface(xappt.BaseInterface):
+    """ A non-interactive interface for running tools from scripts and worker processes.
+    Messages are forwarded to the `xappt` logger, progress updates are discarded and
+    every question is answered with `answer`.
+    """
+    def __init__(self, *, answer: bool = False):
+        super().__init__()
+        self.answer = answer
+
+    def invoke(self, plugin: xappt.BaseTool, **kwargs):
+        plugin.validate()
+        return plugin.execute(**kwargs)
+
+    def message(self, message: str):
+        logger.info(message)
+
+    def warning(self, message: str):
+        logger.warning(message)
+
+    def error(self, message: str, *, details: Optional[str] = None):
+        if details is not None and len(details):
+            message = f"{message}\n{details}"
+        logger.error(message)
+
+    def ask(self, message: str) -> bool:
+        logger.info(f"{message} ({'yes' if self.answer else 'no'})")
+        return self.answer
+
+    def progress_start(self):
+        pass
+
+    def progress_update(self, message: str, percent_complete: float):
+        pass
+
+    def progress_end(self):
+        pass
@@ -0,0 +1,36 @@
+import importlib
+import importlib.util
+import sys
+import threading
+import types
+
+
+class LazyModule(types.ModuleType):
+    """ A stand-in for a module that imports the real module the first time one of its attributes
+    is used, and then keeps a copy of the real module's attributes so later lookups are direct.
+    The import is done under a lock, since the first use may happen on a worker thread.
+    """
+    def __init__(self, name: str):
+        super().__init__(name)
+        self._lazy_lock = threading.Lock()
+
+    def __getattr__(self, item: str):
+        # only called for attributes that have not been copied from the real module yet
+        with self._lazy_lock:
+            module = importlib.import_module(self.__name__)
+            self.__dict__.update(module.__dict__)
+        return getattr(module, item)
+
+
+def lazy_import(name: str) -> types.ModuleType:
+    """ Return `name` as a module that is only imported when it is first used. Modules that have
+    already been imported are returned as they are.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
+
+
+def module_available(name: str) -> bool:
+    """ Check if a top level module can be imported, without importing it. """
+    return name in sys.modules or importlib.util.find_spec(name) is not None
@@ -0,0 +1,56 @@
+import time
+
+from typing import Any, Optional, Tuple
+
+import xappt
+
+
+class ThrottledProgress:
+    """ Forwards progress to an interface, dropping updates that arrive less than `interval` seconds
+    after the last one sent or that move the progress by less than `min_delta`. Messages are format
+    strings that are only filled in with `args` when an update is actually sent. The most recent
+    update is always sent by `end`, so the interface finishes in the final state.
+    """
+    def __init__(self, interface: xappt.BaseInterface, *, interval: float = 0.1, min_delta: float = 0.001):
+        self.interface = interface
+        self.interval = interval
+        self.min_delta = min_delta
+        self._last_time: Optional[float] = None
+        self._last_percent = 0.0
+        self._pending: Optional[Tuple[str, float, Tuple[Any, ...]]] = None
+
+    def __enter__(self) -> "ThrottledProgress":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.end()
+
+    def start(self):
+        self._last_time = None
+        self._last_percent = 0.0
+        self._pending = None
+        self.interface.progress_start()
+
+    def update(self, message: str, percent_complete: float, *args, force: bool = False) -> bool:
+        """ Returns `True` if the update was sent to the interface. """
+        now = time.monotonic()
+        if not force and self._last_time is not None:
+            if now - self._last_time < self.interval or abs(percent_complete - self._last_percent) < self.min_delta:
+                self._pending = (message, percent_complete, args)
+                return False
+        self._send(message, percent_complete, args)
+        self._last_time = now
+        return True
+
+    def end(self):
+        if self._pending is not None:
+            self._send(*self._pending)
+        self.interface.progress_end()
+
+    def _send(self, message: str, percent_complete: float, args: Tuple[Any, ...]):
+        self._pending = None
+        self._last_percent = percent_complete
+        if len(args):
+            message = message.format(*args)
+        self.interface.progress_update(message, percent_complete)
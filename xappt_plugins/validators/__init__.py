@@ -1,3 +1,4 @@
 from .folder_exists import ValidateFolderExists
 from .rect_string import ValidateRectString
 from .file_exists import ValidateFileExists
+from .rect_list_string import ValidateRectListString
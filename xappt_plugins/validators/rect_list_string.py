@@ -0,0 +1,20 @@
+import xappt
+
+from .rect_string import ValidateRectString
+
+
+class ValidateRectListString(ValidateRectString):
+    """ One or more rects separated by semicolons: x1,y1,x2,y2;x1,y1,x2,y2 """
+    def validate(self, value: str) -> str:
+        if not len(value.strip()):
+            return ""
+        rects = []
+        for rect in value.split(";"):
+            rect = super().validate(rect.strip())
+            if not len(rect):
+                raise xappt.ParameterValidationError(f"Rect list '{value}' contains an empty rect.")
+            x1, y1, x2, y2 = map(int, rect.split(","))
+            if x2 <= x1 or y2 <= y1:
+                raise xappt.ParameterValidationError(f"Rect '{rect}' must have x2 > x1 and y2 > y1.")
+            rects.append(rect)
+        return ";".join(rects)